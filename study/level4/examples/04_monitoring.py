@@ -12,7 +12,10 @@
 - 健康检查：liveness 和 readiness
 
 运行要求：
-- pip install prometheus-fastapi-instrumentator opentelemetry-api
+- pip install prometheus-fastapi-instrumentator opentelemetry-api orjson email-validator
+- 可选：pip install opentelemetry-sdk opentelemetry-exporter-otlp
+  opentelemetry-instrumentation-fastapi
+  （并设置 OTEL_EXPORTER_OTLP_ENDPOINT，启用 OpenTelemetry 导出）
 - Prometheus 服务器（可选）
 
 生产环境建议：
@@ -24,24 +27,136 @@
 """
 
 import asyncio
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
+import random
+import secrets
+import shutil
 import time
 import uuid
-from contextlib import asynccontextmanager
-from datetime import datetime
+from collections import deque
+from contextlib import asynccontextmanager, suppress
+from datetime import datetime, timezone
 from enum import Enum
-from typing import Any, Dict, List, Optional
+from typing import Any, Deque, Dict, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, Request, status, Depends
+from fastapi import FastAPI, HTTPException, Request, Response, status, Depends
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field
-from prometheus_client import Counter, Gauge, Histogram, Summary, Info
+import orjson
+from pydantic import BaseModel, EmailStr, Field
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    Info,
+    Summary,
+    generate_latest,
+)
+
+# OpenTelemetry 为可选依赖：未安装时使用下面的简化版追踪器
+try:
+    from opentelemetry import trace as otel_trace
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import (
+        OTLPSpanExporter,
+    )
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    OTEL_AVAILABLE = True
+except ImportError:
+    OTEL_AVAILABLE = False
+
+# datetime.utcnow() 在 3.12 起已弃用，统一使用带时区的当前时间
+_UTC = timezone.utc
 
 # ═══════════════════════════════════════════════════════════════════
 # 结构化日志配置
 # ═══════════════════════════════════════════════════════════════════
 
 
+class OrjsonFormatter(logging.Formatter):
+    """
+    JSON 格式化器（orjson）
+
+    结构化上下文通过 extra={"context": ...} 挂在 LogRecord 上，
+    只有当某个 handler 真正输出这条记录时才会序列化。
+    orjson 直接输出 bytes，比标准库 json 快 3-5 倍。
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "timestamp": record.created,
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        payload.update(getattr(record, "context", {}))
+        return orjson.dumps(payload, default=str).decode()
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    异步日志 handler
+
+    请求路径只负责把 LogRecord 放入队列，格式化和 I/O 由后台
+    QueueListener 线程完成。队列满时丢弃记录，而不是阻塞请求。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 同进程队列无需预格式化，序列化留给监听线程
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+# 有界队列：限制积压日志占用的内存
+_log_queue: queue.Queue = queue.Queue(maxsize=10_000)
+
+# 真正输出日志的 handler，只在监听线程中运行
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(OrjsonFormatter())
+
+_log_listener = logging.handlers.QueueListener(
+    _log_queue, _stream_handler, respect_handler_level=True
+)
+_log_listener_running = False
+
+
+def _start_log_listener() -> None:
+    """启动日志监听线程（重复调用无副作用）"""
+    global _log_listener_running
+    if not _log_listener_running:
+        _log_listener.start()
+        _log_listener_running = True
+
+
+def _stop_log_listener() -> None:
+    """停止监听线程并刷出队列中剩余的日志（重复调用无副作用）"""
+    global _log_listener_running
+    if _log_listener_running:
+        _log_listener.stop()
+        _log_listener_running = False
+
+
+# 导入即启动，脚本/演示直接使用 logger 也能输出；进程退出时兜底刷出剩余日志
+_start_log_listener()
+atexit.register(_stop_log_listener)
+
+# 所有 StructuredLogger 共享同一个 handler，避免重复格式化
+_log_handler = DroppingQueueHandler(_log_queue)
+
+
 class StructuredLogger:
     """
     结构化日志
@@ -60,51 +175,47 @@ class StructuredLogger:
         self.logger = logging.getLogger(name)
         self.logger.setLevel(logging.INFO)
 
-        # JSON 格式化器
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
+        # 不向 root logger 传播，避免同一条记录被多个 handler 重复格式化
+        self.logger.propagate = False
 
-        # 控制台输出
-        handler = logging.StreamHandler()
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
-
-    def _log(self, level: str, message: str, **context):
-        """记录日志"""
-        log_entry = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "message": message,
-            "level": level,
-            **context,
-        }
+        # 控制台输出（共享 handler）
+        if _log_handler not in self.logger.handlers:
+            self.logger.addHandler(_log_handler)
 
-        # 添加请求 ID（如果存在）
-        if "request_id" not in log_entry:
-            log_entry["request_id"] = str(uuid.uuid4())
+    def _log(self, level: int, message: str, **context):
+        """
+        记录日志
 
-        # 记录
-        getattr(self.logger, level.lower())(
-            f"{message} - {context}"
-        )
+        被级别过滤掉的日志直接返回 None，不构造上下文、不生成请求 ID；
+        时间戳、级别、消息由 OrjsonFormatter 从 LogRecord 中读取，无需重复计算。
+        """
+        if not self.logger.isEnabledFor(level):
+            return None
+
+        # 添加请求 ID（调用方未传入时才生成）
+        if "request_id" not in context:
+            context["request_id"] = str(uuid.uuid4())
 
-        return log_entry
+        # 记录：使用 %-参数延迟格式化，上下文交给 OrjsonFormatter 序列化
+        self.logger.log(level, "%s", message, extra={"context": context})
+
+        return context
 
     def info(self, message: str, **context):
         """信息日志"""
-        return self._log("INFO", message, **context)
+        return self._log(logging.INFO, message, **context)
 
     def warning(self, message: str, **context):
         """警告日志"""
-        return self._log("WARNING", message, **context)
+        return self._log(logging.WARNING, message, **context)
 
     def error(self, message: str, **context):
         """错误日志"""
-        return self._log("ERROR", message, **context)
+        return self._log(logging.ERROR, message, **context)
 
     def debug(self, message: str, **context):
         """调试日志"""
-        return self._log("DEBUG", message, **context)
+        return self._log(logging.DEBUG, message, **context)
 
 
 logger = StructuredLogger(__name__)
@@ -138,10 +249,12 @@ class MetricsCollector:
 
     def __init__(self):
         # Counter：HTTP 请求总数
+        # status 只记录状态码类别（2xx/4xx/5xx），避免标签基数爆炸；
+        # 具体状态码写在请求日志的 status_code 字段中
         self.http_requests_total = Counter(
             "http_requests_total",
             "Total HTTP requests",
-            ["method", "endpoint", "status"]
+            ["method", "endpoint", "status"]  # status: 2xx, 3xx, 4xx, 5xx
         )
 
         # Counter：HTTP 错误总数
@@ -225,7 +338,7 @@ class MetricsCollector:
         self.http_requests_total.labels(
             method=method,
             endpoint=endpoint,
-            status=status
+            status=f"{status // 100}xx"
         ).inc()
 
         self.http_request_duration_seconds.labels(
@@ -269,17 +382,25 @@ metrics = MetricsCollector()
 # ═══════════════════════════════════════════════════════════════════
 
 
+# 缓存函数引用，省去每次生成 ID 时的属性查找
+_token_hex = secrets.token_hex
+
+
 class TraceContext:
     """追踪上下文"""
 
+    # 不为每个实例创建 __dict__，节省内存并加快属性访问
+    __slots__ = ("trace_id", "span_id", "parent_span_id")
+
     def __init__(
         self,
         trace_id: Optional[str] = None,
         span_id: Optional[str] = None,
         parent_span_id: Optional[str] = None,
     ):
-        self.trace_id = trace_id or str(uuid.uuid4())
-        self.span_id = span_id or str(uuid.uuid4())[:16]
+        # trace_id 32 位、span_id 16 位十六进制（与 W3C Trace Context 一致）
+        self.trace_id = trace_id or _token_hex(16)
+        self.span_id = span_id or _token_hex(8)
         self.parent_span_id = parent_span_id
 
     def to_dict(self) -> Dict:
@@ -306,29 +427,54 @@ class Span:
         Span 4: 缓存查询（父：Span 2）
     """
 
+    __slots__ = (
+        "name",
+        "tracer",
+        "start_time",
+        "end_time",
+        "parent_span",
+        "context",
+        "tags",
+        "events",
+    )
+
     def __init__(
         self,
         name: str,
         parent_span: Optional["Span"] = None,
         context: Optional[TraceContext] = None,
+        tracer: Optional["Tracer"] = None,
     ):
         self.name = name
+        self.tracer = tracer
         self.start_time = time.time()
         self.end_time: Optional[float] = None
         self.parent_span = parent_span
-        self.context = context or TraceContext(
-            parent_span_id=parent_span.context.span_id if parent_span else None
-        )
-        self.tags: Dict[str, Any] = {}
-        self.events: List[Dict] = []
+        if context is None:
+            # 子 span 继承父 span 的 trace_id，同一条链路共享一个 trace
+            if parent_span is not None:
+                context = TraceContext(
+                    trace_id=parent_span.context.trace_id,
+                    parent_span_id=parent_span.context.span_id,
+                )
+            else:
+                context = TraceContext()
+        self.context = context
+        # 标签和事件按需创建：没有标签的 span 不分配容器
+        self.tags: Optional[Dict[str, Any]] = None
+        self.events: Optional[List[Dict]] = None
 
     def set_tag(self, key: str, value: Any):
         """设置标签"""
+        if self.tags is None:
+            self.tags = {}
         self.tags[key] = value
         return self
 
     def add_event(self, name: str, **attributes):
         """添加事件"""
+        if self.events is None:
+            self.events = []
         self.events.append({
             "name": name,
             "timestamp": time.time(),
@@ -341,13 +487,26 @@ class Span:
         self.end_time = time.time()
         duration = self.end_time - self.start_time
 
-        logger.info(
-            f"Span 完成: {self.name}",
-            duration=duration,
-            **self.context.to_dict(),
-            tags=self.tags,
-            events_count=len(self.events),
-        )
+        # 日志被过滤时不构造 span 记录
+        if not logger.logger.isEnabledFor(logging.INFO):
+            return duration
+
+        record = {
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration": duration,
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_span_id": self.context.parent_span_id,
+            "tags": self.tags or {},
+            "events_count": len(self.events) if self.events else 0,
+        }
+
+        if self.tracer is not None:
+            # 交给 Tracer 批量输出
+            self.tracer.record(record)
+        else:
+            logger.info(f"Span 完成: {self.name}", **record)
 
         return duration
 
@@ -362,27 +521,187 @@ class Span:
 
 
 class Tracer:
-    """追踪器"""
+    """
+    追踪器
 
-    def __init__(self, service_name: str):
+    批量输出：
+        span 结束时只把记录追加到有界环形缓冲区（deque），
+        后台任务每 FLUSH_INTERVAL 秒（或积压超过 HIGH_WATERMARK 时）
+        把整批记录合并成一条日志输出，而不是每个 span 输出一次。
+        缓冲区满时最旧的记录被丢弃，内存占用有上限。
+    """
+
+    FLUSH_INTERVAL = 0.1
+    HIGH_WATERMARK = 1_000
+
+    def __init__(self, service_name: str, buffer_size: int = 10_000):
         self.service_name = service_name
+        self._ring: Deque[Dict[str, Any]] = deque(maxlen=buffer_size)
+        self._flush_needed: Optional[asyncio.Event] = None
 
     def start_span(
         self,
         name: str,
         parent_span: Optional[Span] = None,
     ) -> Span:
-        """开始一个 span"""
-        span = Span(name, parent_span)
+        """开始一个 span（开始时间随完成记录一起输出）"""
+        return Span(name, parent_span, tracer=self)
+
+    def record(self, span_record: Dict[str, Any]):
+        """缓存一条 span 记录"""
+        self._ring.append(span_record)
+        if (
+            self._flush_needed is not None
+            and len(self._ring) >= self.HIGH_WATERMARK
+        ):
+            self._flush_needed.set()
+
+    def flush(self) -> int:
+        """把缓冲区中的 span 合并为一条日志输出，返回输出的数量"""
+        if not self._ring:
+            return 0
+
+        batch = list(self._ring)
+        self._ring.clear()
         logger.info(
-            f"Span 开始: {name}",
-            **span.context.to_dict(),
+            "Span 批量输出",
+            service=self.service_name,
+            spans=batch,
         )
-        return span
+        return len(batch)
+
+    async def run_flusher(self):
+        """后台定时刷新（在 lifespan 中启动）"""
+        self._flush_needed = asyncio.Event()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(
+                        self._flush_needed.wait(), self.FLUSH_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_needed.clear()
+                self.flush()
+        finally:
+            self._flush_needed = None
+            self.flush()
 
 
 tracer = Tracer("fastapi-service")
 
+
+# ═══════════════════════════════════════════════════════════════════
+# OpenTelemetry（生产环境）
+# ═══════════════════════════════════════════════════════════════════
+
+
+class OtelSpan:
+    """
+    OpenTelemetry span 适配器
+
+    提供与上面 Span 相同的接口（set_tag / add_event / context），
+    业务代码无需关心底层用的是哪种追踪器。
+    """
+
+    __slots__ = ("_span", "_scope", "context")
+
+    def __init__(self, otel_span, scope=None):
+        self._span = otel_span
+        self._scope = scope
+        span_context = otel_span.get_span_context()
+        self.context = TraceContext(
+            trace_id=format(span_context.trace_id, "032x"),
+            span_id=format(span_context.span_id, "016x"),
+        )
+
+    def set_tag(self, key: str, value: Any):
+        """设置标签（OpenTelemetry attribute）"""
+        self._span.set_attribute(key, value)
+        return self
+
+    def add_event(self, name: str, **attributes):
+        """添加事件"""
+        self._span.add_event(name, attributes)
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, tb):
+        # 由 start_as_current_span 创建的 span 在这里结束；
+        # 请求级 span 由 FastAPIInstrumentor 负责结束
+        if self._scope is not None:
+            return self._scope.__exit__(exc_type, exc_val, tb)
+        return None
+
+
+class OtelTracer:
+    """
+    基于 OpenTelemetry SDK 的追踪器
+
+    与 Tracer 接口一致；父子关系由 OpenTelemetry 的当前上下文自动维护，
+    span 由 BatchSpanProcessor 批量导出（默认每 5 秒 / 512 个一批）。
+    """
+
+    def __init__(self, service_name: str):
+        self.service_name = service_name
+        self._tracer = otel_trace.get_tracer(service_name)
+
+    def start_span(
+        self,
+        name: str,
+        parent_span: Optional[Span] = None,
+    ) -> OtelSpan:
+        """开始一个 span（parent_span 由当前上下文决定，这里忽略）"""
+        scope = self._tracer.start_as_current_span(name)
+        return OtelSpan(scope.__enter__(), scope)
+
+    def flush(self) -> int:
+        """
+        与 Tracer.flush 接口一致
+
+        span 由 BatchSpanProcessor 在后台导出，这里只请求立即导出一次；
+        本地没有缓冲，返回 0
+        """
+        provider = otel_trace.get_tracer_provider()
+        force_flush = getattr(provider, "force_flush", None)
+        if force_flush is not None:
+            force_flush()
+        return 0
+
+
+def setup_opentelemetry(
+    app: FastAPI,
+    service_name: str,
+    sample_ratio: float = 0.01,
+) -> bool:
+    """
+    启用 OpenTelemetry
+
+    - 采样：ParentBased(TraceIdRatioBased)，上游已采样的请求保持一致
+    - 导出：BatchSpanProcessor + OTLP（地址读取 OTEL_EXPORTER_OTLP_ENDPOINT）
+    - 插桩：FastAPIInstrumentor 为每个请求自动创建 span
+
+    返回是否启用成功（未安装依赖或未配置导出地址时返回 False）。
+    """
+    if not OTEL_AVAILABLE or not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return False
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        sampler=ParentBased(TraceIdRatioBased(sample_ratio)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    otel_trace.set_tracer_provider(provider)
+
+    FastAPIInstrumentor.instrument_app(app, tracer_provider=provider)
+    return True
+
+
+# 是否使用 OpenTelemetry（创建 app 后由 setup_opentelemetry 决定）
+USE_OTEL = False
+
 # ═══════════════════════════════════════════════════════════════════
 # 中间件
 # ═══════════════════════════════════════════════════════════════════
@@ -401,8 +720,13 @@ async def logging_middleware(request: Request, call_next):
     # 生成请求 ID
     request_id = str(uuid.uuid4())
 
-    # 开始 span
-    with tracer.start_span(f"{request.method} {request.url.path}") as span:
+    # 开始 span：启用 OpenTelemetry 时请求级 span 已由 FastAPIInstrumentor 创建
+    if USE_OTEL:
+        request_span = OtelSpan(otel_trace.get_current_span())
+    else:
+        request_span = tracer.start_span(f"{request.method} {request.url.path}")
+
+    with request_span as span:
         span.set_tag("http.method", request.method)
         span.set_tag("http.url", str(request.url))
         span.set_tag("http.request_id", request_id)
@@ -497,6 +821,14 @@ class HealthStatus(str, Enum):
     UNHEALTHY = "unhealthy"
 
 
+# 状态严重程度：用于计算总体状态
+_HEALTH_SEVERITY = {
+    HealthStatus.HEALTHY.value: 0,
+    HealthStatus.DEGRADED.value: 1,
+    HealthStatus.UNHEALTHY.value: 2,
+}
+
+
 class HealthCheckResult(BaseModel):
     """健康检查结果"""
     status: HealthStatus
@@ -520,12 +852,17 @@ class HealthChecker:
         - 磁盘空间
     """
 
+    # 磁盘检查结果缓存时间（秒）
+    DISK_CHECK_TTL = 5.0
+
     def __init__(self):
         self.checks = {
             "database": self._check_database,
             "redis": self._check_redis,
             "disk": self._check_disk,
         }
+        # 磁盘检查缓存：(检查时间, 结果)
+        self._disk_cache: Tuple[float, Dict[str, Any]] = (float("-inf"), {})
 
     async def _check_database(self) -> Dict[str, Any]:
         """检查数据库连接"""
@@ -560,53 +897,64 @@ class HealthChecker:
             }
 
     async def _check_disk(self) -> Dict[str, Any]:
-        """检查磁盘空间"""
-        import shutil
+        """
+        检查磁盘空间
 
-        # 模拟磁盘检查
-        usage = shutil.disk_usage("/")
+        statvfs 是真实的系统调用（网络文件系统上尤其慢），
+        结果缓存 DISK_CHECK_TTL 秒，探针频繁重试时不会重复调用。
+        """
+        checked_at, cached = self._disk_cache
+        if time.monotonic() - checked_at < self.DISK_CHECK_TTL:
+            return cached
 
-        # 使用率超过 80% 警告
-        if usage.percent > 80:
-            return {
-                "status": "degraded",
-                "usage_percent": usage.percent,
-                "free_gb": usage.free / (1024**3),
-            }
+        usage = shutil.disk_usage("/")
+        # disk_usage 只返回 (total, used, free)，使用率需要自己算
+        usage_percent = usage.used / usage.total * 100
 
-        return {
-            "status": "healthy",
-            "usage_percent": usage.percent,
+        result = {
+            # 使用率超过 80% 警告
+            "status": "degraded" if usage_percent > 80 else "healthy",
+            "usage_percent": usage_percent,
             "free_gb": usage.free / (1024**3),
         }
+        self._disk_cache = (time.monotonic(), result)
+        return result
+
+    @staticmethod
+    async def _safe(check_func) -> Dict[str, Any]:
+        """执行单个检查，异常转换为 unhealthy 结果"""
+        try:
+            return await check_func()
+        except Exception as e:
+            return {
+                "status": "unhealthy",
+                "error": str(e),
+            }
 
     async def check(self) -> HealthCheckResult:
-        """执行所有检查"""
-        results = {}
-
-        for name, check_func in self.checks.items():
-            try:
-                results[name] = await check_func()
-            except Exception as e:
-                results[name] = {
-                    "status": "unhealthy",
-                    "error": str(e),
-                }
-
-        # 计算总体状态
-        statuses = [r["status"] for r in results.values()]
-
-        if "unhealthy" in statuses:
-            overall_status = HealthStatus.UNHEALTHY
-        elif "degraded" in statuses:
-            overall_status = HealthStatus.DEGRADED
-        else:
-            overall_status = HealthStatus.HEALTHY
+        """
+        执行所有检查
+
+        各检查项相互独立，并发执行：总耗时 ≈ 最慢的一项，而不是所有项之和
+        """
+        results_list = await asyncio.gather(
+            *(self._safe(check_func) for check_func in self.checks.values())
+        )
+        results = dict(zip(self.checks, results_list))
+
+        # 计算总体状态：取最严重的一项
+        overall_status = HealthStatus(
+            max(
+                (r["status"] for r in results.values()),
+                key=_HEALTH_SEVERITY.get,
+                default=HealthStatus.HEALTHY.value,
+            )
+        )
 
         return HealthCheckResult(
             status=overall_status,
             version="1.0.0",
-            timestamp=datetime.utcnow(),
+            timestamp=datetime.now(_UTC),
             checks=results,
         )
 
@@ -620,7 +968,8 @@ health_checker = HealthChecker()
 
 class UserCreate(BaseModel):
     username: str = Field(..., min_length=3, max_length=50)
-    email: str = Field(..., pattern=r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
+    # EmailStr 由 email-validator 校验，不再每次请求执行回溯正则
+    email: EmailStr
 
 
 class UserResponse(BaseModel):
@@ -651,6 +1000,10 @@ class OrderResponse(BaseModel):
 class UserService:
     """用户服务（带监控）"""
 
+    def __init__(self):
+        # 每个服务独立的随机数生成器，不与全局 random 共享状态
+        self._rng = random.Random()
+
     async def create_user(self, user_data: UserCreate) -> UserResponse:
         """创建用户（带追踪）"""
         with tracer.start_span("UserService.create_user") as span:
@@ -660,10 +1013,10 @@ class UserService:
             await asyncio.sleep(0.01)
 
             user = UserResponse(
-                id=random.randint(1000, 9999),
+                id=self._rng.randint(1000, 9999),
                 username=user_data.username,
                 email=user_data.email,
-                created_at=datetime.utcnow(),
+                created_at=datetime.now(_UTC),
             )
 
             span.add_event("user_created", user_id=user.id)
@@ -683,6 +1036,9 @@ class UserService:
 class OrderService:
     """订单服务（带监控）"""
 
+    def __init__(self):
+        self._rng = random.Random()
+
     async def create_order(self, order_data: OrderCreate) -> OrderResponse:
         """创建订单（带追踪）"""
         with tracer.start_span("OrderService.create_order") as span:
@@ -693,11 +1049,11 @@ class OrderService:
             await asyncio.sleep(0.02)
 
             order = OrderResponse(
-                id=random.randint(10000, 99999),
+                id=self._rng.randint(10000, 99999),
                 user_id=order_data.user_id,
                 amount=order_data.amount,
                 status="pending",
-                created_at=datetime.utcnow(),
+                created_at=datetime.now(_UTC),
             )
 
             span.add_event("order_created", order_id=order.id)
@@ -723,10 +1079,20 @@ class OrderService:
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     # 启动
+    # 上一次 lifespan 关闭时已停止监听线程，这里重新启动（与关闭时的 stop 对称）
+    _start_log_listener()
     logger.info("应用启动", version="1.0.0")
+    # 简化版追踪器需要后台刷新任务；OpenTelemetry 由 BatchSpanProcessor 负责导出
+    flusher = None if USE_OTEL else asyncio.create_task(tracer.run_flusher())
     yield
     # 关闭
+    if flusher is not None:
+        flusher.cancel()
+        with suppress(asyncio.CancelledError):
+            await flusher
     logger.info("应用关闭")
+    # 停止监听线程，刷出队列中剩余的日志
+    _stop_log_listener()
 
 
 app = FastAPI(
@@ -739,6 +1105,11 @@ app = FastAPI(
 # 添加中间件
 app.middleware("http")(logging_middleware)
 
+# 可选：切换到 OpenTelemetry（在中间件之后插桩，使其位于最外层）
+USE_OTEL = setup_opentelemetry(app, "fastapi-service")
+if USE_OTEL:
+    tracer = OtelTracer("fastapi-service")
+
 # 服务实例
 user_service = UserService()
 order_service = OrderService()
@@ -814,11 +1185,9 @@ async def metrics_endpoint():
               - targets: ['localhost:8000']
             metrics_path: /metrics
     """
-    from prometheus_client import generate_latest
-
     return Response(
         content=generate_latest(),
-        media_type="text/plain",
+        media_type=CONTENT_TYPE_LATEST,
     )
 
 
@@ -831,12 +1200,6 @@ async def get_traces():
     }
 
 
-import random
-
-
-from fastapi import Response
-
-
 # ═══════════════════════════════════════════════════════════════════
 # 演示和测试
 # ═══════════════════════════════════════════════════════════════════
@@ -924,6 +1287,9 @@ async def demo_distributed_tracing():
             await asyncio.sleep(0.02)
             api_span.set_tag("external.api", "payment-service")
 
+    # 演示中没有后台刷新任务，手动输出缓冲的 span
+    tracer.flush()
+
 
 async def demo_health_checks():
     """演示健康检查"""
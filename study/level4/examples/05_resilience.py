@@ -19,7 +19,7 @@
     6. 幂等：安全重试
 
 运行要求：
-- 无特殊依赖（使用 mock）
+- pip install orjson（外部服务使用 mock）
 
 生产环境建议：
 - 使用 Hystrix、Resilience4j 等库
@@ -29,16 +29,32 @@
 """
 
 import asyncio
+import functools
 import random
+import sys
 import time
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from contextlib import asynccontextmanager
 from dataclasses import dataclass
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 from enum import Enum
-from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+from types import MappingProxyType
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Literal,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+)
 
 from fastapi import FastAPI, HTTPException, status
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 
 # ═══════════════════════════════════════════════════════════════════
@@ -53,6 +69,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 # ═══════════════════════════════════════════════════════════════════
 # 舱壁隔离（Bulkhead Pattern）
 # ═══════════════════════════════════════════════════════════════════
@@ -76,7 +94,8 @@ class Bulkhead:
         - 使用隔离：最多 10 个并发查询数据库，其他请求快速失败
 
     实现：
-        使用信号量限制并发数
+        使用 Condition 保护的计数器限制并发数
+        （与信号量不同，上限可以在运行时安全调整，见 resize）
 
     类比：
         泰坦尼克号：船舱分隔，一个漏水不会沉没整艘船
@@ -85,30 +104,41 @@ class Bulkhead:
     def __init__(self, max_concurrent: int, name: str = "default"):
         self.max_concurrent = max_concurrent
         self.name = name
-        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self._cond = asyncio.Condition()
         self.active_count = 0
         self.rejected_count = 0
 
     async def __aenter__(self):
-        """进入隔离区"""
-        acquired = await self.semaphore.acquire()
-
-        if not acquired:
-            self.rejected_count += 1
-            logger.warning(f"[Bulkhead] {self.name}: 并发数已满，拒绝请求")
-            raise BulkheadIsolationError(f"并发数已达上限 {self.max_concurrent}")
+        """进入隔离区（并发数已满时等待空位）"""
+        async with self._cond:
+            await self._cond.wait_for(
+                lambda: self.active_count < self.max_concurrent
+            )
+            self.active_count += 1
 
-        self.active_count += 1
         logger.debug(f"[Bulkhead] {self.name}: 活跃数 {self.active_count}/{self.max_concurrent}")
 
         return self
 
     async def __aexit__(self, exc_type, exc_val, tb):
         """退出隔离区"""
-        self.active_count -= 1
-        self.semaphore.release()
+        async with self._cond:
+            self.active_count -= 1
+            self._cond.notify(1)
         logger.debug(f"[Bulkhead] {self.name}: 活跃数 {self.active_count}/{self.max_concurrent}")
 
+    async def resize(self, max_concurrent: int):
+        """
+        动态调整并发上限
+
+        调大时唤醒所有等待者重新检查条件；
+        调小时已进入的请求不受影响，新请求等活跃数降下来后再进入。
+        """
+        async with self._cond:
+            self.max_concurrent = max_concurrent
+            self._cond.notify_all()
+        logger.info(f"[Bulkhead] {self.name}: 并发上限调整为 {max_concurrent}")
+
     def get_stats(self) -> Dict:
         """获取统计信息"""
         return {
@@ -129,6 +159,10 @@ class TimeoutError(Exception):
     pass
 
 
+# asyncio.timeout() 从 Python 3.11 开始提供
+_HAS_ASYNCIO_TIMEOUT = sys.version_info >= (3, 11)
+
+
 async def with_timeout(coro: Awaitable, timeout: float) -> Any:
     """
     超时控制
@@ -143,19 +177,139 @@ async def with_timeout(coro: Awaitable, timeout: float) -> Any:
 
     原则：
         快速失败优于挂起
+
+    实现：
+        Python 3.11+ 使用 asyncio.timeout() 直接在当前任务上计时，
+        不像 wait_for 那样额外包装一个 Task
     """
     try:
+        if _HAS_ASYNCIO_TIMEOUT:
+            async with asyncio.timeout(timeout):
+                return await coro
         return await asyncio.wait_for(coro, timeout=timeout)
     except asyncio.TimeoutError:
         raise TimeoutError(f"操作超时（{timeout}秒）")
 
 
 # ═══════════════════════════════════════════════════════════════════
-# 重试策略（指数退避）
+# 熔断器（Circuit Breaker）
 # ═══════════════════════════════════════════════════════════════════
 
 
-T = TypeVar("T")
+class CircuitOpenError(Exception):
+    """熔断异常：熔断器已打开，快速失败"""
+    pass
+
+
+class CircuitState(str, Enum):
+    """熔断器状态"""
+    CLOSED = "closed"          # 正常放行
+    OPEN = "open"              # 熔断，直接拒绝
+    HALF_OPEN = "half_open"    # 试探，放行一个请求
+
+
+class CircuitBreaker:
+    """
+    熔断器（Circuit Breaker）
+
+    场景：
+        外部依赖持续故障时，不再每次都等待超时和重试
+
+        问题场景：
+        - 外部服务宕机，超时 2 秒 × 重试 3 次
+        - 不使用熔断：每个请求都要等 6 秒才降级
+        - 使用熔断：连续失败达到阈值后直接失败，立即降级
+
+    状态转换：
+        CLOSED --连续失败 failure_threshold 次--> OPEN
+        OPEN --经过 recovery_timeout 秒--> HALF_OPEN
+        HALF_OPEN --试探成功--> CLOSED
+        HALF_OPEN --试探失败--> OPEN
+
+    类比：
+        家里的保险丝：电流过大时断开，避免烧毁整个电路
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        name: str = "default",
+    ):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.name = name
+        self.state = CircuitState.CLOSED
+        self.failure_count = 0
+        self.last_failure_ts = 0.0
+        self.rejected_count = 0
+
+    async def call(self, func: Callable[[], Awaitable[T]]) -> T:
+        """通过熔断器执行函数"""
+        if self.state == CircuitState.OPEN:
+            if time.monotonic() - self.last_failure_ts < self.recovery_timeout:
+                self.rejected_count += 1
+                raise CircuitOpenError(f"熔断器 {self.name} 已打开")
+
+            # 冷却结束：放行一个试探请求
+            self.state = CircuitState.HALF_OPEN
+            logger.info(f"[CircuitBreaker] {self.name}: 进入半开状态，试探请求")
+
+        elif self.state == CircuitState.HALF_OPEN:
+            # 已有试探请求在执行，其余请求继续快速失败
+            self.rejected_count += 1
+            raise CircuitOpenError(f"熔断器 {self.name} 正在试探恢复")
+
+        try:
+            result = await func()
+        except Exception:
+            self._on_failure()
+            raise
+        except BaseException:
+            # 试探请求被取消（客户端断开、超时等）：结果未知，回到 OPEN 重新冷却，
+            # 否则熔断器会永远卡在 HALF_OPEN，拒绝所有后续请求
+            if self.state == CircuitState.HALF_OPEN:
+                self.state = CircuitState.OPEN
+                self.last_failure_ts = time.monotonic()
+            raise
+
+        self._on_success()
+        return result
+
+    def _on_success(self):
+        if self.state != CircuitState.CLOSED:
+            logger.info(f"[CircuitBreaker] {self.name}: 恢复，关闭熔断器")
+        self.state = CircuitState.CLOSED
+        self.failure_count = 0
+
+    def _on_failure(self):
+        self.failure_count += 1
+        self.last_failure_ts = time.monotonic()
+
+        if (
+            self.state == CircuitState.HALF_OPEN
+            or self.failure_count >= self.failure_threshold
+        ):
+            if self.state != CircuitState.OPEN:
+                logger.warning(
+                    f"[CircuitBreaker] {self.name}: 连续失败 "
+                    f"{self.failure_count} 次，打开熔断器"
+                )
+            self.state = CircuitState.OPEN
+
+    def get_stats(self) -> Dict:
+        """获取统计信息"""
+        return {
+            "name": self.name,
+            "state": self.state.value,
+            "failure_count": self.failure_count,
+            "rejected_count": self.rejected_count,
+        }
+
+
+# ═══════════════════════════════════════════════════════════════════
+# 重试策略（指数退避）
+# ═══════════════════════════════════════════════════════════════════
 
 
 class RetryPolicy:
@@ -174,13 +328,31 @@ class RetryPolicy:
             attempt 2: 4s
             attempt 3: 8s
 
+    可重试的异常：
+        只重试 retryable 中的异常；non_retryable（舱壁已满、熔断器打开）
+        以及 HTTP 4xx 错误立即抛出，不浪费重试次数
+
     添加抖动（Jitter）：
         避免雷鸣羊群效应
 
         问题：多个请求同时失败，同时重试，造成新的冲击
-        解决：添加随机偏移（±25%）
+        解决：在退避窗口内随机选择延迟（jitter_mode）
+            - "full"（默认）：random(0, delay)，重试在整个窗口内均匀分散
+            - "equal"：delay/2 + random(0, delay/2)，保留一半的最小等待
+            - "decorrelated"：random(base_delay, 上次延迟 * 3)，与上次延迟相关
+            - "none"：不加抖动
+
+        示例（base_delay=1, full jitter）：
+            attempt 0: 0~1s
+            attempt 1: 0~2s
+            attempt 2: 0~4s
     """
 
+    JITTER_MODES = ("none", "equal", "full", "decorrelated")
+
+    # 绝对上限：无论如何配置，单次重试等待不超过 24 小时
+    ABSOLUTE_MAX = 86400.0
+
     def __init__(
         self,
         max_attempts: int = 3,
@@ -188,16 +360,31 @@ class RetryPolicy:
         max_delay: float = 60.0,
         backoff_factor: float = 2.0,
         jitter: bool = True,
+        jitter_mode: Literal["none", "equal", "full", "decorrelated"] = "full",
+        retryable: Tuple[Type[BaseException], ...] = (Exception,),
+        non_retryable: Tuple[Type[BaseException], ...] = (
+            BulkheadIsolationError,
+            CircuitOpenError,
+        ),
     ):
-        self.max_attempts = max_attempts
+        if jitter_mode not in self.JITTER_MODES:
+            raise ValueError(f"未知的 jitter_mode: {jitter_mode}")
+
         self.base_delay = base_delay
-        self.max_delay = max_delay
         self.backoff_factor = backoff_factor
+        self._max_attempts = max_attempts
+        self._max_delay = min(max_delay, self.ABSOLUTE_MAX)
+        self._rebuild_delays()
         self.jitter = jitter
+        # jitter=False 等价于 jitter_mode="none"
+        self.jitter_mode = jitter_mode if jitter else "none"
+        # 只重试 retryable 中的异常；non_retryable 优先，立即抛出
+        self.retryable = retryable
+        self.non_retryable = non_retryable
 
     async def execute(self, func: Callable[[], Awaitable[T]]) -> T:
         """执行带重试的函数"""
-        last_exception = None
+        delay = self.base_delay
 
         for attempt in range(self.max_attempts):
             try:
@@ -205,43 +392,102 @@ class RetryPolicy:
                 result = await func()
 
                 if attempt > 0:
-                    logger.info(f"[Retry] 第 {attempt + 1} 次尝试成功")
+                    logger.info("[Retry] 第 %d 次尝试成功", attempt + 1)
 
                 return result
 
-            except Exception as e:
-                last_exception = e
-
-                # 是否还有重试机会
-                if attempt < self.max_attempts - 1:
-                    # 计算延迟
-                    delay = self._calculate_delay(attempt)
+            except self.non_retryable:
+                # 结果不会因重试而改变（如舱壁已满、熔断器打开）
+                raise
 
-                    logger.warning(
-                        f"[Retry] 第 {attempt + 1} 次尝试失败: {e}, "
-                        f"{delay:.2f}秒后重试"
-                    )
+            except self.retryable as e:
+                # 客户端错误（4xx）重试也不会成功
+                if isinstance(e, HTTPException) and 400 <= e.status_code < 500:
+                    raise
 
-                    await asyncio.sleep(delay)
-                else:
+                # 没有重试机会：原样抛出当前异常（保留原始 traceback）
+                if attempt == self.max_attempts - 1:
                     logger.error(
-                        f"[Retry] 已达最大重试次数 {self.max_attempts}，放弃"
+                        "[Retry] 已达最大重试次数 %d，放弃", self.max_attempts
                     )
+                    raise
+
+                # 计算延迟
+                delay = self._calculate_delay(attempt, delay)
+
+                logger.warning(
+                    "[Retry] 第 %d 次尝试失败: %s, %.2f秒后重试",
+                    attempt + 1,
+                    e,
+                    delay,
+                )
+
+                await asyncio.sleep(delay)
+
+    @property
+    def max_attempts(self) -> int:
+        """最大尝试次数"""
+        return self._max_attempts
+
+    @max_attempts.setter
+    def max_attempts(self, value: int):
+        self._max_attempts = value
+        self._rebuild_delays()
+
+    @property
+    def max_delay(self) -> float:
+        """单次延迟上限（可在运行时调低，例如测试中）"""
+        return self._max_delay
 
-        raise last_exception
+    @max_delay.setter
+    def max_delay(self, value: float):
+        self._max_delay = min(value, self.ABSOLUTE_MAX)
+        self._rebuild_delays()
 
-    def _calculate_delay(self, attempt: int) -> float:
-        """计算延迟时间（指数退避 + 抖动）"""
-        delay = min(
-            self.base_delay * (self.backoff_factor ** attempt),
-            self.max_delay
+    def _backoff(self, attempt: int) -> float:
+        """第 attempt 次的退避值（不含抖动，已限制在 max_delay 内）"""
+        try:
+            return min(
+                self.base_delay * (self.backoff_factor ** attempt),
+                self._max_delay
+            )
+        except OverflowError:
+            return self._max_delay
+
+    def _rebuild_delays(self):
+        """预先计算每次重试的退避值，重试时直接查表"""
+        self._base_delays = tuple(
+            self._backoff(attempt) for attempt in range(self._max_attempts)
         )
 
-        if self.jitter:
-            # 添加 ±25% 的随机抖动
-            delay = delay * random.uniform(0.75, 1.25)
+    def _calculate_delay(self, attempt: int, prev_delay: float) -> float:
+        """
+        计算延迟时间（指数退避 + 抖动）
+
+        先把退避值限制在 max_delay 内，再在这个窗口内加抖动，
+        最后统一裁剪到 [0, max_delay]：
+            - 抖动不会把延迟推到 max_delay 之上
+            - 退避值很大时也不会所有调用方都收敛到同一个 max_delay
+        """
+        max_delay = self._max_delay
 
-        return delay
+        if self.jitter_mode == "decorrelated":
+            # 去相关抖动：基于上一次的实际延迟，而不是 attempt
+            delay = random.uniform(self.base_delay, prev_delay * 3)
+        else:
+            delays = self._base_delays
+            delay = (
+                delays[attempt] if attempt < len(delays)
+                else self._backoff(attempt)
+            )
+
+            if self.jitter_mode == "full":
+                delay = random.random() * delay
+            elif self.jitter_mode == "equal":
+                half = delay / 2
+                delay = half + random.random() * half
+
+        return max(0.0, min(delay, max_delay))
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -325,44 +571,91 @@ class IdempotencyKey:
 
     实现：
         使用幂等键记录请求结果
+        - 有界 LRU（OrderedDict）：超过 capacity 时淘汰最久未使用的键
+        - 读取时惰性检查过期（expire_seconds），过期后重新执行
+        - 相同幂等键并发到达时只执行一次，其余调用等待同一个结果
+        - 首个调用被取消时，等待者重新竞争执行，而不是一起收到 CancelledError
     """
 
-    def __init__(self):
-        self._store: Dict[str, Any] = {}
+    # 首个调用被取消时放入 Future 的哨兵值，通知等待者重新执行
+    _LEADER_CANCELLED = object()
+
+    def __init__(self, capacity: int = 10_000):
+        self.capacity = capacity
+        # key -> (写入时间 time.monotonic(), 结果)，按最近使用排序
+        self._store: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        # 正在执行中的幂等键 -> 结果 Future
+        self._inflight: Dict[str, asyncio.Future] = {}
 
     async def process(
         self,
         key: str,
         func: Callable[[], Awaitable[T]],
         expire_seconds: int = 3600,
+        discard_result: bool = False,
     ) -> T:
         """
         幂等处理
 
         流程：
-            1. 检查幂等键是否存在
+            1. 检查幂等键是否存在且未过期
             2. 存在则返回之前的结果
             3. 不存在则执行函数并缓存结果
-        """
-        # 1. 检查是否已处理
-        if key in self._store:
-            logger.info(f"[Idempotency] 幂等键已存在: {key}")
-            result = self._store[key]
-            return result["data"]
-
-        # 2. 执行函数
-        logger.info(f"[Idempotency] 首次处理: {key}")
-        result = await func()
 
-        # 3. 缓存结果
-        self._store[key] = {
-            "data": result,
-            "timestamp": datetime.utcnow(),
-        }
+        discard_result=True 时不缓存结果（不关心返回值的调用）
+        """
+        while True:
+            # 1. 检查是否已处理
+            entry = self._store.get(key)
+            if entry is not None:
+                stored_at, data = entry
+                if time.monotonic() - stored_at <= expire_seconds:
+                    logger.info(f"[Idempotency] 幂等键已存在: {key}")
+                    self._store.move_to_end(key)
+                    return data
+
+                # 已过期：删除后重新执行
+                del self._store[key]
+
+            # 2. 相同的键正在处理：等待第一个调用的结果，不重复执行
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            logger.info(f"[Idempotency] 幂等键处理中，等待结果: {key}")
+            result = await asyncio.shield(inflight)
+            if result is not self._LEADER_CANCELLED:
+                return result
+            # 首个调用被取消、没有结果：回到开头，由某个等待者接手执行
+            logger.info(f"[Idempotency] 首个调用已取消，重新处理: {key}")
 
-        # 4. 设置过期（可选）
-        # 真实环境应使用 Redis
+        # 检查和登记之间没有 await，单线程事件循环中不存在竞态
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
 
+        # 3. 执行函数
+        logger.info(f"[Idempotency] 首次处理: {key}")
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            # 不取消共享的 Future：那会把 CancelledError 传给所有等待者
+            future.set_result(self._LEADER_CANCELLED)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 标记异常已读取，避免没有等待者时输出告警
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+        # 4. 缓存结果，超出容量时淘汰最久未使用的键
+        # 真实环境应使用 Redis（SET key value EX expire_seconds）
+        if not discard_result:
+            self._store[key] = (time.monotonic(), result)
+            while len(self._store) > self.capacity:
+                self._store.popitem(last=False)
+
+        future.set_result(result)
         return result
 
     def clear(self):
@@ -378,6 +671,17 @@ idempotency_store = IdempotencyKey()
 # ═══════════════════════════════════════════════════════════════════
 
 
+# 模拟外部服务使用的随机数：独立的 Random 实例，方法预先绑定，
+# 避免压测演示时把时间花在 random 模块的属性查找上
+_rand = random.Random()
+_uniform = _rand.uniform
+_choice = _rand.choice
+_rand_f = _rand.random
+
+# 模拟的失败类型
+_FAILURE_MODES = ("timeout", "error", "slow")
+
+
 class ExternalService:
     """
     外部服务（模拟）
@@ -398,11 +702,11 @@ class ExternalService:
         self.request_count += 1
 
         # 模拟网络延迟
-        await asyncio.sleep(random.uniform(0.1, 0.5))
+        await asyncio.sleep(_uniform(0.1, 0.5))
 
         # 模拟失败
-        if random.random() < self.failure_rate:
-            failure_type = random.choice(["timeout", "error", "slow"])
+        if _rand_f() < self.failure_rate:
+            failure_type = _choice(_FAILURE_MODES)
 
             if failure_type == "timeout":
                 # 模拟超时（慢响应）
@@ -416,11 +720,11 @@ class ExternalService:
                 # 模拟慢响应（2 秒）
                 await asyncio.sleep(2.0)
 
-        # 正常响应
+        # 正常响应（不再附带格式化的时间戳：调用方从未使用，
+        # 每次调用都构造 datetime 再格式化成字符串是纯开销）
         return {
             "operation": operation,
             "status": "success",
-            "timestamp": datetime.utcnow().isoformat(),
         }
 
 
@@ -436,6 +740,12 @@ def resilient(
     max_retries: int = 3,
     bulkhead_max: Optional[int] = None,
     fallback_func: Optional[Callable] = None,
+    circuit_breaker: Optional[CircuitBreaker] = None,
+    retryable: Tuple[Type[BaseException], ...] = (Exception,),
+    non_retryable: Tuple[Type[BaseException], ...] = (
+        BulkheadIsolationError,
+        CircuitOpenError,
+    ),
 ):
     """
     弹性装饰器（组合多种模式）
@@ -445,6 +755,11 @@ def resilient(
         max_retries: 最大重试次数
         bulkhead_max: 并发限制
         fallback_func: 降级函数
+        circuit_breaker: 熔断器（在重试之前判断，熔断时不消耗重试次数）
+        retryable / non_retryable: 可重试 / 不可重试的异常类型
+
+    执行顺序：
+        熔断 → 舱壁 → 重试 → 超时，失败后降级
 
     使用示例：
         @resilient(timeout=3.0, max_retries=3, bulkhead_max=10)
@@ -452,14 +767,20 @@ def resilient(
             return await external_service.call("test")
     """
     def decorator(func):
-        async def wrapper(*args, **kwargs):
-            # 1. 舱壁隔离
-            if bulkhead_max:
-                bulkhead = Bulkhead(bulkhead_max, func.__name__)
-
-            # 2. 重试策略
-            retry_policy = RetryPolicy(max_attempts=max_retries)
+        # 舱壁和重试策略按被装饰函数创建一次，所有调用共享；
+        # 如果每次调用都新建舱壁，每个调用独占一个计数器，起不到隔离作用
+        # 1. 舱壁隔离
+        bulkhead = Bulkhead(bulkhead_max, func.__name__) if bulkhead_max else None
+
+        # 2. 重试策略
+        retry_policy = RetryPolicy(
+            max_attempts=max_retries,
+            retryable=retryable,
+            non_retryable=non_retryable,
+        )
 
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
             # 定义执行逻辑
             async def execute():
                 # 超时控制
@@ -468,15 +789,18 @@ def resilient(
                 else:
                     return await func(*args, **kwargs)
 
-            # 3. 执行（带重试）
-            try:
-                if bulkhead_max:
+            async def guarded():
+                # 3. 执行（带重试）
+                if bulkhead is not None:
                     async with bulkhead:
-                        result = await retry_policy.execute(execute)
-                else:
-                    result = await retry_policy.execute(execute)
+                        return await retry_policy.execute(execute)
+                return await retry_policy.execute(execute)
 
-                return result
+            try:
+                # 熔断器在最外层：依赖已知故障时不占用舱壁、不重试
+                if circuit_breaker is not None:
+                    return await circuit_breaker.call(guarded)
+                return await guarded()
 
             except Exception as e:
                 # 4. 降级
@@ -485,6 +809,8 @@ def resilient(
                     return await fallback_func(*args, **kwargs)
                 raise
 
+        # 暴露舱壁，便于查看统计信息
+        wrapper.bulkhead = bulkhead
         return wrapper
     return decorator
 
@@ -499,6 +825,7 @@ class ProductService:
     产品服务（带弹性）
 
     展示：
+        - 熔断器
         - 舱壁隔离
         - 超时控制
         - 重试策略
@@ -506,6 +833,7 @@ class ProductService:
     """
 
     def __init__(self):
+        self.circuit_breaker = CircuitBreaker(name="product_service")
         self.bulkhead = Bulkhead(max_concurrent=10, name="product_service")
         self.retry_policy = RetryPolicy(max_attempts=3)
         self._cache = {
@@ -520,9 +848,10 @@ class ProductService:
         弹性策略：
             1. 先查缓存（降级）
             2. 缓存未命中则调用外部服务
-            3. 使用舱壁隔离
-            4. 设置超时
-            5. 失败则返回缓存数据
+            3. 熔断器打开时直接降级
+            4. 使用舱壁隔离
+            5. 设置超时
+            6. 失败则返回缓存数据
         """
         logger.info(f"[ProductService] 获取产品: {product_id}")
 
@@ -531,32 +860,37 @@ class ProductService:
             logger.info(f"[ProductService] 缓存命中: {product_id}")
             return self._cache[product_id]
 
-        # 2. 调用外部服务（带弹性）
-        async with self.bulkhead:
-            try:
-                result = await with_timeout(
-                    external_service.call(f"product_{product_id}"),
-                    timeout=2.0
-                )
-                return result
+        # 2. 调用外部服务（熔断 → 舱壁 → 超时）
+        try:
+            return await self.circuit_breaker.call(
+                lambda: self._fetch_product(product_id)
+            )
 
-            except TimeoutError:
-                logger.warning(f"[ProductService] 外部服务超时，使用降级")
-                # 降级：返回默认产品
-                return {
-                    "id": product_id,
-                    "name": "Unknown Product",
-                    "price": 0.0,
-                    "in_stock": False,
-                    "_degraded": True,
-                }
+        except (TimeoutError, CircuitOpenError) as e:
+            logger.warning(f"[ProductService] 外部服务不可用（{e}），使用降级")
+            # 降级：返回默认产品
+            return {
+                "id": product_id,
+                "name": "Unknown Product",
+                "price": 0.0,
+                "in_stock": False,
+                "_degraded": True,
+            }
 
-            except Exception as e:
-                logger.error(f"[ProductService] 外部服务失败: {e}")
-                raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail="产品服务暂时不可用",
-                )
+        except Exception as e:
+            logger.error(f"[ProductService] 外部服务失败: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="产品服务暂时不可用",
+            )
+
+    async def _fetch_product(self, product_id: int) -> Dict:
+        """调用外部服务获取产品（舱壁 + 超时）"""
+        async with self.bulkhead:
+            return await with_timeout(
+                external_service.call(f"product_{product_id}"),
+                timeout=2.0
+            )
 
     async def get_product_with_retry(self, product_id: int) -> Dict:
         """获取产品（带重试）"""
@@ -611,7 +945,8 @@ class OrderService:
                 "product_id": product_id,
                 "amount": amount,
                 "status": "completed",
-                "created_at": datetime.utcnow().isoformat(),
+                # 直接保存 datetime，由 FastAPI 序列化响应时再格式化
+                "created_at": datetime.now(timezone.utc),
             }
 
         return await self.idempotency.process(
@@ -621,21 +956,32 @@ class OrderService:
         )
 
 
+# 热门推荐（降级结果）：模块级不可变元组，降级时不再每次新建列表
+_POPULAR_FALLBACK: Tuple[str, ...] = (
+    "Popular Product 1",
+    "Popular Product 2",
+    "Popular Product 3",
+)
+
+
 class RecommendationService:
     """
     推荐服务（多级降级）
 
     展示：
         - 多级降级策略
+        - 熔断器
     """
 
     def __init__(self):
-        self._user_recommendations = {
-            1: ["Product A", "Product B", "Product C"],
-            2: ["Product D", "Product E"],
-        }
-
-    async def get_recommendations(self, user_id: int) -> List[str]:
+        self.circuit_breaker = CircuitBreaker(name="recommendation_service")
+        # 只读映射：推荐结果为不可变元组，可以直接返回而无需复制
+        self._user_recommendations: Mapping[int, Tuple[str, ...]] = MappingProxyType({
+            1: ("Product A", "Product B", "Product C"),
+            2: ("Product D", "Product E"),
+        })
+
+    async def get_recommendations(self, user_id: int) -> Sequence[str]:
         """
         获取推荐（多级降级）
 
@@ -650,14 +996,16 @@ class RecommendationService:
         if user_id in self._user_recommendations:
             try:
                 # 模拟外部推荐服务
-                result = await external_service.call(f"recommend_{user_id}")
+                result = await self.circuit_breaker.call(
+                    lambda: external_service.call(f"recommend_{user_id}")
+                )
                 return self._user_recommendations[user_id]
             except Exception as e:
                 logger.warning(f"[RecommendationService] 个性化推荐失败: {e}")
 
         # 一级降级：热门推荐
         logger.info(f"[RecommendationService] 使用热门推荐（降级）")
-        return ["Popular Product 1", "Popular Product 2", "Popular Product 3"]
+        return _POPULAR_FALLBACK
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -706,6 +1054,8 @@ app = FastAPI(
     description="展示弹性设计的最佳实践",
     version="1.0.0",
     lifespan=lifespan,
+    # orjson 序列化比标准库 json 快数倍
+    default_response_class=ORJSONResponse,
 )
 
 # 服务实例
@@ -737,8 +1087,8 @@ async def get_product(product_id: int):
         - 超时控制
         - 服务降级
     """
-    product = await product_service.get_product(product_id)
-    return ProductResponse(**product)
+    # 直接返回 dict，由 response_model 校验并过滤字段（只经过一次 Pydantic）
+    return await product_service.get_product(product_id)
 
 
 @app.post("/orders", response_model=CreateOrderResponse, status_code=status.HTTP_201_CREATED)
@@ -783,6 +1133,15 @@ async def get_bulkhead_stats():
     return product_service.bulkhead.get_stats()
 
 
+@app.get("/stats/circuit-breakers")
+async def get_circuit_breaker_stats():
+    """获取熔断器统计"""
+    return [
+        product_service.circuit_breaker.get_stats(),
+        recommendation_service.circuit_breaker.get_stats(),
+    ]
+
+
 # ═══════════════════════════════════════════════════════════════════
 # 演示和测试
 # ═══════════════════════════════════════════════════════════════════
@@ -853,12 +1212,15 @@ async def demo_bulkhead():
 
     # 5 个任务，但最多 2 个并发
     print("\n启动 5 个任务（最多 2 个并发）:")
-    tasks = [
-        task(f"Task-{i}", random.uniform(0.5, 1.0))
-        for i in range(5)
-    ]
-
-    await asyncio.gather(*tasks)
+    if sys.version_info >= (3, 11):
+        # TaskGroup（Python 3.11+）：不需要中间列表，任一任务异常时取消其余任务
+        async with asyncio.TaskGroup() as tg:
+            for i in range(5):
+                tg.create_task(task(f"Task-{i}", random.uniform(0.5, 1.0)))
+    else:
+        await asyncio.gather(
+            *(task(f"Task-{i}", random.uniform(0.5, 1.0)) for i in range(5))
+        )
 
     print(f"\n统计: {bulkhead.get_stats()}")
 
@@ -935,6 +1297,37 @@ async def demo_resilient_decorator():
         print(f"  ✗ 失败: {e}")
 
 
+async def demo_circuit_breaker():
+    """演示熔断器"""
+    print("\n" + "="*60)
+    print("演示 7: 熔断器")
+    print("="*60)
+
+    breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=0.5, name="demo")
+
+    async def broken_service():
+        raise Exception("服务宕机")
+
+    async def healthy_service():
+        return "恢复正常"
+
+    print("\n连续调用故障服务:")
+    for i in range(5):
+        try:
+            await breaker.call(broken_service)
+        except CircuitOpenError as e:
+            print(f"  调用 {i + 1}: 快速失败 - {e}")
+        except Exception as e:
+            print(f"  调用 {i + 1}: 失败 - {e}")
+
+    print("\n等待冷却后试探:")
+    await asyncio.sleep(0.5)
+    result = await breaker.call(healthy_service)
+    print(f"  结果: {result}")
+
+    print(f"\n统计: {breaker.get_stats()}")
+
+
 async def main():
     """运行所有演示"""
     print("\n🚀 弹性设计示例")
@@ -946,6 +1339,7 @@ async def main():
         await demo_fallback()
         await demo_idempotency()
         await demo_resilient_decorator()
+        await demo_circuit_breaker()
 
         print("\n" + "="*60)
         print("✅ 所有演示完成！")
@@ -957,6 +1351,7 @@ async def main():
         print("  POST   /orders                       # 创建订单（幂等）")
         print("  GET    /users/{id}/recommendations  # 获取推荐（多级降级）")
         print("  GET    /stats/bulkhead              # 舱壁隔离统计")
+        print("  GET    /stats/circuit-breakers      # 熔断器统计")
 
     except Exception as e:
         logger.error(f"演示失败: {e}")
@@ -4,10 +4,33 @@ APScheduler配置
 
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.executors.pool import ThreadPoolExecutor
+from sqlalchemy import create_engine, event
+
+# JobStore引擎
+# SQLite默认journal_mode=DELETE，每次提交都要fsync并独占写锁；
+# WAL模式下提交只追加日志，读写可以并发
+JOBSTORE_ENGINE = create_engine(
+    'sqlite:///jobs.db',
+    connect_args={'check_same_thread': False, 'timeout': 30},
+    pool_size=5,
+    max_overflow=10,
+)
+
+
+@event.listens_for(JOBSTORE_ENGINE, "connect")
+def _sqlite_pragmas(dbapi_conn, _):
+    """每个新连接设置SQLite参数"""
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
 
 # JobStore配置
+# 生产环境建议换成PostgreSQL
 JOBSTORES = {
-    'default': SQLAlchemyJobStore(url='sqlite:///jobs.db')
+    'default': SQLAlchemyJobStore(engine=JOBSTORE_ENGINE)
 }
 
 # Executor配置
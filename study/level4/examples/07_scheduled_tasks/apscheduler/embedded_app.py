@@ -7,12 +7,23 @@ APScheduler嵌入FastAPI示例
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.executors.pool import ThreadPoolExecutor
 import logging
 
 logger = logging.getLogger(__name__)
 
 # 创建调度器
-scheduler = AsyncIOScheduler()
+# 任务都是async def：默认用AsyncIOExecutor直接在事件循环中运行，
+# 不经过线程池切换；同步的CPU密集任务显式指定executor='threadpool'
+# 注意：不要复用config.py的SCHEDULER_CONFIG，那是给独立进程用的
+scheduler = AsyncIOScheduler(
+    executors={
+        'default': AsyncIOExecutor(),
+        'threadpool': ThreadPoolExecutor(max_workers=4),
+    },
+    job_defaults={'coalesce': True, 'max_instances': 3},
+)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -34,11 +45,16 @@ async def health_check_task():
     logger.info("Running health check...")
 
 # 添加定时任务
+# 显式设置coalesce和misfire_grace_time，不依赖共享配置；
+# max_instances=1：上一次健康检查还没结束时不再叠加新的检查
 scheduler.add_job(
     health_check_task,
     'interval',
     minutes=5,
-    id='health_check'
+    id='health_check',
+    coalesce=True,
+    misfire_grace_time=60,
+    max_instances=1
 )
 
 @app.get("/")
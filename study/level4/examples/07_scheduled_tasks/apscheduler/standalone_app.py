@@ -22,12 +22,14 @@ def task2():
     logger.info("Executing task2...")
 
 # 添加任务
+# misfire_grace_time按任务周期设置：周期越长，允许的补跑窗口越大
 scheduler.add_job(
     task1,
     'interval',
     minutes=10,
     id='task1',
-    name='Periodic Task 1'
+    name='Periodic Task 1',
+    misfire_grace_time=300
 )
 
 scheduler.add_job(
@@ -35,7 +37,8 @@ scheduler.add_job(
     'cron',
     hour='*/2',
     id='task2',
-    name='Periodic Task 2'
+    name='Periodic Task 2',
+    misfire_grace_time=1800
 )
 
 if __name__ == "__main__":
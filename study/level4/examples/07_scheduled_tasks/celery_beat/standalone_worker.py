@@ -4,6 +4,10 @@ Celery独立Worker示例
 启动命令：
   celery -A standalone_worker worker --loglevel=info
 
+I/O密集任务（如send_email）使用gevent池，单进程即可并发处理数百个任务：
+  pip install gevent
+  celery -A standalone_worker worker -P gevent -c 500 --loglevel=info
+
 启动Beat：
   celery -A standalone_worker beat --loglevel=info
 """
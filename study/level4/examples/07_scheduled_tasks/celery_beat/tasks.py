@@ -19,6 +19,11 @@ app.conf.update(
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
+    # 任务执行完才确认；worker异常退出时任务重新入队，而不是悄悄丢失
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    # 每个进程只预取一个任务，慢任务不会压住其他任务
+    worker_prefetch_multiplier=1,
 )
 
 # 定义任务
@@ -29,21 +34,28 @@ def add(x, y):
     logger.info(f"Adding {x} + {y} = {result}")
     return result
 
-@app.task
+# I/O任务：失败时交给Celery按指数退避重新调度（释放worker），
+# 而不是在任务里sleep等待；大量并发I/O建议使用gevent池（见standalone_worker.py）
+@app.task(
+    autoretry_for=(ConnectionError, TimeoutError),
+    retry_backoff=True,
+    max_retries=3,
+)
 def send_email(to, subject, body):
     """发送邮件任务"""
     logger.info(f"Sending email to {to}: {subject}")
-    # 模拟发送邮件
-    import time
-    time.sleep(1)
+    # 真实环境在这里调用SMTP/邮件API（不要用time.sleep模拟阻塞）
     logger.info(f"Email sent to {to}")
     return {"status": "sent", "to": to}
 
-@app.task
+@app.task(
+    autoretry_for=(ConnectionError, TimeoutError),
+    retry_backoff=True,
+    max_retries=3,
+)
 def generate_report(report_type):
     """生成报表任务"""
     logger.info(f"Generating {report_type} report...")
-    import time
-    time.sleep(2)
+    # 真实环境在这里查询数据并生成报表
     logger.info(f"{report_type} report generated")
     return {"report": report_type, "status": "completed"}
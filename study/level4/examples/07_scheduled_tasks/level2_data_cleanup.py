@@ -7,11 +7,21 @@ Level 2: 数据清理任务
 - 任务失败自动重试
 
 运行：python level2_data_cleanup.py
+调试：DEBUG=true python level2_data_cleanup.py（每30秒清理一次token）
 """
 
 import asyncio
+import gzip
+import os
+import shutil
+import signal
+from contextlib import suppress
+from pathlib import Path
+from apscheduler.events import EVENT_JOB_MISSED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from datetime import datetime
+from apscheduler.triggers.combining import OrTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from datetime import datetime, timezone
 import logging
 
 # 配置日志
@@ -21,28 +31,51 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# zstd压缩速度约为gzip的3倍、压缩率相近；未安装时退回标准库gzip
+try:
+    import zstandard as zstd
+    ARCHIVE_SUFFIX = ".zst"
+except ImportError:
+    zstd = None
+    ARCHIVE_SUFFIX = ".gz"
+
+# 待归档的日志目录
+LOG_DIR = Path("logs")
+
+# 调试模式：额外每30秒触发一次token清理，方便观察
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
 class DataCleanupService:
     """数据清理服务"""
 
     def __init__(self):
-        self.scheduler = AsyncIOScheduler()
+        # 任务默认配置：积压的多次触发合并为一次，同一任务不重叠执行
+        self.scheduler = AsyncIOScheduler(job_defaults={
+            'coalesce': True,
+            'max_instances': 1,
+            'misfire_grace_time': 60,
+        })
+        self.scheduler.add_listener(self._on_job_missed, EVENT_JOB_MISSED)
+
+    def _on_job_missed(self, event):
+        """任务错过执行时间（超过misfire_grace_time）时记录日志"""
+        logger.warning(
+            "Job %s missed its run time %s",
+            event.job_id, event.scheduled_run_time
+        )
 
     async def cleanup_expired_tokens(self):
         """清理过期token（Level 2示例）"""
         try:
             logger.info("Starting token cleanup...")
 
-            # 模拟数据库操作
-            expired_tokens = await self._get_expired_tokens()
-            logger.info(f"Found {len(expired_tokens)} expired tokens")
-
-            # 删除过期token
-            deleted = await self._delete_tokens(expired_tokens)
+            # 一条DELETE完成，不把过期token先查出来再逐条删除
+            deleted = await self._delete_expired_tokens(datetime.now(timezone.utc))
 
-            logger.info(f"Cleanup completed: {deleted} tokens deleted")
+            logger.info("Cleanup completed: %d tokens deleted", deleted)
 
         except Exception as e:
-            logger.error(f"Token cleanup failed: {e}")
+            logger.error("Token cleanup failed: %s", e)
             raise
 
     async def archive_logs(self):
@@ -50,44 +83,82 @@ class DataCleanupService:
         try:
             logger.info("Starting log archival...")
 
-            # 模拟归档操作
-            await self._compress_logs()
-            await self._upload_to_storage()
+            # 流水线：上传第N个文件的同时压缩第N+1个
+            upload = None
+            try:
+                for path in sorted(LOG_DIR.glob("*.log")):
+                    archived = await self._compress_logs(path)
+                    if upload:
+                        await upload
+                    upload = asyncio.create_task(self._archive_one(path, archived))
+                if upload:
+                    await upload
+            finally:
+                # 压缩失败（或任务被取消）时不留下无人等待的上传任务；
+                # 未上传完的源文件仍在，下次归档会重新处理
+                if upload and not upload.done():
+                    upload.cancel()
+                    with suppress(asyncio.CancelledError):
+                        await upload
 
             logger.info("Log archival completed")
 
         except Exception as e:
-            logger.error(f"Log archival failed: {e}")
+            logger.error("Log archival failed: %s", e)
             raise
 
-    async def _get_expired_tokens(self):
-        """模拟：获取过期token"""
-        await asyncio.sleep(0.1)  # 模拟数据库查询
-        return list(range(10))  # 模拟10个过期token
-
-    async def _delete_tokens(self, tokens):
-        """模拟：删除token"""
-        await asyncio.sleep(0.2)
-        return len(tokens)
-
-    async def _compress_logs(self):
-        """模拟：压缩日志"""
-        await asyncio.sleep(1)
-
-    async def _upload_to_storage(self):
+    async def _delete_expired_tokens(self, now: datetime) -> int:
+        """
+        模拟：批量删除过期token，返回删除行数
+
+        真实实现（SQLAlchemy）：
+            async with AsyncSession(engine) as session:
+                result = await session.execute(
+                    delete(Token).where(Token.expires_at < now)
+                )
+                await session.commit()
+                return result.rowcount
+        """
+        await asyncio.sleep(0.1)  # 模拟一次数据库往返
+        return 10  # 模拟删除了10个过期token
+
+    async def _compress_logs(self, path: Path) -> Path:
+        """压缩日志：CPU密集操作放到线程池执行，不阻塞事件循环"""
+        return await asyncio.to_thread(self._compress_sync, path)
+
+    def _compress_sync(self, path: Path) -> Path:
+        """流式压缩单个日志文件（同步）"""
+        out = path.with_name(path.name + ARCHIVE_SUFFIX)
+        with path.open("rb") as src, out.open("wb") as dst:
+            if zstd is not None:
+                zstd.ZstdCompressor(level=3).copy_stream(src, dst)
+            else:
+                with gzip.GzipFile(fileobj=dst, mode="wb") as gz:
+                    shutil.copyfileobj(src, gz)
+        return out
+
+    async def _archive_one(self, source: Path, archived: Path):
+        """上传压缩文件，成功后删除源日志，避免下次重复归档"""
+        await self._upload_to_storage(archived)
+        source.unlink(missing_ok=True)
+
+    async def _upload_to_storage(self, path: Path):
         """模拟：上传存储"""
         await asyncio.sleep(2)
+        logger.info("Uploaded %s", path.name)
 
     def start(self):
         """启动调度器"""
-        # 每小时清理过期token
+        # 每小时清理过期token；调试模式下合并一个30秒触发器（仍是同一个任务）
+        trigger = IntervalTrigger(hours=1)
+        if DEBUG:
+            trigger = OrTrigger([trigger, IntervalTrigger(seconds=30)])
+
         self.scheduler.add_job(
             self.cleanup_expired_tokens,
-            'interval',
-            hours=1,
+            trigger=trigger,
             id='cleanup_tokens',
-            max_instances=1,  # 防止任务重叠
-            misfire_grace_time=300  # 容忍5秒延迟
+            misfire_grace_time=300  # 容忍5分钟延迟
         )
 
         # 每天凌晨2点归档日志
@@ -96,28 +167,26 @@ class DataCleanupService:
             'cron',
             hour=2,
             minute=0,
-            id='archive_logs',
-            max_instances=1
-        )
-
-        # 测试用：每30秒执行一次
-        self.scheduler.add_job(
-            self.cleanup_expired_tokens,
-            'interval',
-            seconds=30,
-            id='test_cleanup'
+            id='archive_logs'
         )
 
         self.scheduler.start()
         logger.info("Data cleanup service started")
 
-# 运行
-if __name__ == "__main__":
+async def main():
+    """在事件循环内启动调度器，收到SIGINT/SIGTERM后退出"""
     service = DataCleanupService()
     service.start()
 
-    try:
-        asyncio.Event().wait()  # 保持运行
-    except KeyboardInterrupt:
-        logger.info("Shutting down...")
-        service.scheduler.shutdown()
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await stop_event.wait()  # 保持运行
+    logger.info("Shutting down...")
+    service.scheduler.shutdown(wait=False)
+
+# 运行
+if __name__ == "__main__":
+    asyncio.run(main())
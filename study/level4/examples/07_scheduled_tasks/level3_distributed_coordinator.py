@@ -1,50 +1,171 @@
 """
 Level 3: 分布式任务协调
 
-问题：多实例部署时，任务会重复执行
-方案：使用Redis分布式锁
-
-运行：
+问题：多实例部署时，任务会重复执行；执行者宕机时任务会丢失
+方案：Redis队列 + worker租约
+- 触发：每个实例的调度器都会触发，但同一时间槽只有一个实例能把任务入队（SET NX）
+- 执行：抢到worker租约（SET NX EX + 心跳续期）的实例用BLMOVE把任务移入处理中列表，
+  执行成功后LREM确认
+- 故障转移：worker宕机后租约过期，其他实例接管，并把处理中列表里未确认的任务放回队列，
+  队列中和执行到一半的任务都不会丢
+
+运行（需要本地Redis）：
 - 终端1：python level3_distributed_coordinator.py --instance-id=node1
 - 终端2：python level3_distributed_coordinator.py --instance-id=node2
-观察：只有一个实例执行任务
+观察：只有一个实例执行任务；停掉它后另一个实例接管
 """
 
 import asyncio
 import argparse
+import json
+import signal
+import time
+import uuid
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from datetime import datetime
 import logging
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
+# 任务触发间隔（秒）：所有实例按同一时钟对齐触发
+TRIGGER_INTERVAL = 15
+
+# 待执行任务队列（LPUSH入队，右端出队 → FIFO）
+QUEUE_KEY = "mq:monthly_report"
+# 处理中列表：出队时原子移入，执行成功后删除（ack）；worker崩溃时任务留在这里等待恢复
+PROCESSING_KEY = "mq:monthly_report:processing"
+# 执行失败的任务，留待人工排查，避免反复重试同一个坏任务
+FAILED_KEY = "mq:monthly_report:failed"
+
+# worker租约：持有者崩溃后自动过期，由其他实例接管
+WORKER_KEY = "worker:monthly_report"
+WORKER_TTL = 30
+HEARTBEAT_INTERVAL = 10
+
+# 只有租约仍属于自己（token一致）时才删除，GET+DEL在Redis内原子执行
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# 只有租约仍属于自己时才续期
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
 class DistributedScheduler:
-    """分布式任务调度器（模拟版本）"""
+    """分布式任务调度器（Redis队列 + worker租约）"""
 
-    def __init__(self, instance_id: str):
+    def __init__(self, instance_id: str, redis_url: str = "redis://localhost:6379/0"):
         self.instance_id = instance_id
         self.scheduler = AsyncIOScheduler()
-        # 模拟Redis锁
-        self.lock_acquired = False
+        self.redis = aioredis.from_url(redis_url)
+        # 租约token：每个实例唯一，防止误删/误续其他实例的租约
+        self.token = f"{instance_id}:{uuid.uuid4().hex}"
+        self._worker_task: Optional[asyncio.Task] = None
 
     async def distributed_task(self):
-        """分布式任务（只在一个实例上执行）"""
-
-        # 模拟获取分布式锁
-        lock_key = "lock:monthly_report"
-
-        # 简化版：第一个实例获取锁
-        if not self.lock_acquired and self.instance_id == "node1":
-            self.lock_acquired = True
-            logger.info(f"[{self.instance_id}] Lock acquired, starting task...")
+        """触发任务：同一时间槽只有一个实例能入队"""
+        slot = round(time.time() / TRIGGER_INTERVAL)
+        first = await self.redis.set(
+            f"{QUEUE_KEY}:slot:{slot}", self.instance_id,
+            nx=True, ex=TRIGGER_INTERVAL * 2
+        )
+        if not first:
+            return
 
-            # 执行任务（模拟月报生成）
+        await self.redis.lpush(
+            QUEUE_KEY,
+            json.dumps({"ts": time.time(), "node": self.instance_id})
+        )
+        logger.info(f"[{self.instance_id}] Task enqueued (slot {slot})")
+
+    async def _heartbeat(self):
+        """定期续租；续租失败说明租约已丢失，协程结束"""
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                renewed = await self.redis.eval(
+                    _RENEW_SCRIPT, 1, WORKER_KEY, self.token, WORKER_TTL
+                )
+            except RedisError as e:
+                # 续租失败无法确认租约仍属于自己，按丢失处理，交给worker_loop重新竞争
+                logger.warning(f"[{self.instance_id}] Lease renewal failed: {e}")
+                return
+            if not renewed:
+                logger.warning(f"[{self.instance_id}] Worker lease lost")
+                return
+
+    async def worker_loop(self):
+        """消费者：抢到租约后串行执行队列中的任务；Redis故障时等待后重新竞争租约"""
+        while True:
+            try:
+                await self._work_while_leased()
+            except RedisError as e:
+                # 连接断开等故障不能让worker协程退出，否则本实例再也不会参与竞争
+                logger.error(f"[{self.instance_id}] Redis error in worker loop: {e}")
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    async def _work_while_leased(self):
+        """一轮租约：没抢到时等待；抢到后执行任务直到租约丢失"""
+        acquired = await self.redis.set(
+            WORKER_KEY, self.token, nx=True, ex=WORKER_TTL
+        )
+        if not acquired:
+            # 其他实例是worker，等它的租约过期再抢
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            return
+
+        logger.info(f"[{self.instance_id}] Became worker")
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            await self._requeue_unacked()
+            while not heartbeat.done():
+                payload = await self.redis.blmove(
+                    QUEUE_KEY, PROCESSING_KEY, 5, "RIGHT", "LEFT"
+                )
+                if payload is None:
+                    continue
+                await self._run_item(payload)
+        finally:
+            heartbeat.cancel()
+            # 尽力释放：Redis不可用时租约也会在WORKER_TTL后自动过期
+            try:
+                await self.redis.eval(_RELEASE_SCRIPT, 1, WORKER_KEY, self.token)
+            except RedisError as e:
+                logger.warning(f"[{self.instance_id}] Lease release failed: {e}")
+
+    async def _requeue_unacked(self):
+        """接管时把上一任worker未确认的任务放回队列出队端，优先执行"""
+        while True:
+            payload = await self.redis.lmove(PROCESSING_KEY, QUEUE_KEY, "LEFT", "RIGHT")
+            if payload is None:
+                return
+            logger.warning(f"[{self.instance_id}] Requeued unacked task {payload!r}")
+
+    async def _run_item(self, payload: bytes):
+        """执行单个任务：成功后ack；失败记录日志并移入失败列表，不中断worker循环"""
+        try:
+            logger.info(f"[{self.instance_id}] Running task {json.loads(payload)}")
             await self._generate_monthly_report()
+        except Exception:
+            logger.exception(f"[{self.instance_id}] Task failed: {payload!r}")
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.lrem(PROCESSING_KEY, 1, payload)
+                pipe.lpush(FAILED_KEY, payload)
+                await pipe.execute()
+            return
 
-            logger.info(f"[{self.instance_id}] Task completed")
-            self.lock_acquired = False
-        else:
-            logger.info(f"[{self.instance_id}] Another instance is running the task")
+        await self.redis.lrem(PROCESSING_KEY, 1, payload)
+        logger.info(f"[{self.instance_id}] Task completed")
 
     async def _generate_monthly_report(self):
         """生成月报（模拟耗时操作）"""
@@ -53,18 +174,30 @@ class DistributedScheduler:
         logger.info("Monthly report generated")
 
     def start(self):
-        """启动调度器"""
-        # 测试用：每15秒执行一次
+        """启动调度器和worker"""
+        # 测试用：每15秒执行一次（cron按整点秒对齐，各实例落在同一时间槽）
         self.scheduler.add_job(
             self.distributed_task,
-            'interval',
-            seconds=15,
+            'cron',
+            second=f'*/{TRIGGER_INTERVAL}',
             id='test_distributed_task'
         )
 
         self.scheduler.start()
+        self._worker_task = asyncio.create_task(self.worker_loop())
         logger.info(f"[{self.instance_id}] Distributed scheduler started")
 
+    async def stop(self):
+        """停止调度器和worker（worker退出时释放租约）"""
+        self.scheduler.shutdown(wait=False)
+        if self._worker_task:
+            self._worker_task.cancel()
+            try:
+                await self._worker_task
+            except asyncio.CancelledError:
+                pass
+        await self.redis.aclose()
+
 # 运行
 if __name__ == "__main__":
     logging.basicConfig(
@@ -74,13 +207,21 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--instance-id", default="node1")
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
     args = parser.parse_args()
 
-    coordinator = DistributedScheduler(args.instance_id)
-    coordinator.start()
+    async def main():
+        # Redis客户端和调度器都需要运行中的事件循环
+        coordinator = DistributedScheduler(args.instance_id, args.redis_url)
+        coordinator.start()
+
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
 
-    try:
-        asyncio.Event().wait()
-    except KeyboardInterrupt:
+        await stop_event.wait()
         logger.info(f"[{args.instance_id}] Shutting down...")
-        coordinator.scheduler.shutdown()
+        await coordinator.stop()
+
+    asyncio.run(main())
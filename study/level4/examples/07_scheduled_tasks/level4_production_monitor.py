@@ -11,16 +11,27 @@ Level 4: 生产级定时任务监控
 访问：http://localhost:8000/docs
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
+from apscheduler.events import (
+    EVENT_JOB_ADDED, EVENT_JOB_ERROR, EVENT_JOB_MODIFIED, EVENT_JOB_REMOVED
+)
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
-from apscheduler.executors.pool import AsyncIOExecutor
-from datetime import datetime
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from sqlalchemy import create_engine, event, text
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
 import uvicorn
-from typing import List, Optional
+from typing import Iterator, List, Optional
 import logging
 import asyncio
+import os
+import time
+import httpx
+import msgpack
 
 # 日志配置
 logging.basicConfig(level=logging.INFO)
@@ -43,16 +54,94 @@ class TaskStatus(BaseModel):
     trigger: str
     executions: List[TaskExecution]
 
+# 同时执行的任务上限（AsyncIOExecutor本身不限制并发）
+MAX_CONCURRENT_TASKS = 10
+
+# 失败告警：攒批发送到Webhook，一次请求最多带ALERT_BATCH_SIZE条
+# 未配置ALERT_WEBHOOK_URL时只打日志
+ALERT_WEBHOOK_URL = os.getenv("ALERT_WEBHOOK_URL")
+ALERT_BATCH_SIZE = 20
+ALERT_BATCH_WINDOW = 0.5
+
+# msgpack流式响应中每个分块包含的执行记录数
+STREAM_CHUNK_SIZE = 64
+
+# 任务列表缓存时间（秒）：面板轮询时避免每次都从JobStore反序列化全部任务
+LIST_CACHE_TTL = 1.0
+
+# 每个任务保留的最近执行记录数（环形缓冲，超出后丢弃最旧的）
+MAX_HISTORY_PER_TASK = 500
+
+# 执行记录批量落库：攒够一批或超过间隔就写一次，摊薄事务/fsync开销
+FLUSH_BATCH_SIZE = 100
+FLUSH_INTERVAL = 2.0
+
+_CREATE_EXECUTIONS = text("""
+    CREATE TABLE IF NOT EXISTS executions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        started_at TIMESTAMP NOT NULL,
+        completed_at TIMESTAMP,
+        duration REAL,
+        error TEXT
+    )
+""")
+_INSERT_EXECUTION = text("""
+    INSERT INTO executions
+        (task_id, status, started_at, completed_at, duration, error)
+    VALUES
+        (:task_id, :status, :started_at, :completed_at, :duration, :error)
+""")
+
+
+@dataclass(slots=True)
+class _Exec:
+    """内部执行记录（轻量dataclass，只在API边界转换为TaskExecution）"""
+    task_id: str
+    status: str
+    started_at: datetime
+    completed_at: Optional[datetime] = None
+    duration: Optional[float] = None
+    error: Optional[str] = None
+
+    def as_params(self) -> dict:
+        """转换为SQL参数（浅拷贝字段，避免dataclasses.asdict的递归深拷贝）"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+def _sqlite_pragmas(dbapi_conn, _):
+    """每个新连接设置SQLite参数：WAL下批量写入不阻塞调度器读任务"""
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA optimize")
+    cursor.close()
+
+def _make_engine(db_url: str, **kwargs):
+    """创建带SQLite参数的engine"""
+    engine = create_engine(
+        db_url,
+        pool_pre_ping=True,
+        connect_args={"check_same_thread": False},
+        **kwargs
+    )
+    event.listen(engine, "connect", _sqlite_pragmas)
+    return engine
+
 # 生产级调度器
 class ProductionScheduler:
     """生产级定时任务调度器"""
 
     def __init__(self, db_url: str = "sqlite:///tasks.db"):
+        # 执行记录用的engine（连接池复用连接）
+        self.engine = _make_engine(db_url)
+        # JobStore独占一个engine：编译后的SQL缓存不会被其他查询挤出
+        self.jobstore_engine = _make_engine(db_url, query_cache_size=1200)
         jobstores = {
-            'default': SQLAlchemyJobStore(url=db_url)
+            'default': SQLAlchemyJobStore(engine=self.jobstore_engine)
         }
         executors = {
-            'default': AsyncIOExecutor(max_workers=10)
+            'default': AsyncIOExecutor()
         }
 
         self.scheduler = AsyncIOScheduler(
@@ -65,7 +154,25 @@ class ProductionScheduler:
             }
         )
 
-        self.execution_history: dict = {}
+        self.execution_history: dict[str, deque] = defaultdict(
+            lambda: deque(maxlen=MAX_HISTORY_PER_TASK)
+        )
+        self._exec_queue: asyncio.Queue = asyncio.Queue()
+        self._flush_task: Optional[asyncio.Task] = None
+        # 任务列表缓存：(生成时间, 列表)，任务增删改时失效
+        self._list_cache: tuple = (0.0, None)
+        # 触发器描述缓存：job_id -> str(trigger)，只在任务增删改时变化
+        self._trigger_repr: dict[str, str] = {}
+        self.scheduler.add_listener(
+            self._invalidate_list_cache,
+            EVENT_JOB_ADDED | EVENT_JOB_REMOVED | EVENT_JOB_MODIFIED
+        )
+        # 失败告警队列（由EVENT_JOB_ERROR监听器写入，后台协程批量发送）
+        self._alert_queue: asyncio.Queue = asyncio.Queue()
+        self._alert_task: Optional[asyncio.Task] = None
+        self.scheduler.add_listener(self._on_job_error, EVENT_JOB_ERROR)
+        # 并发准入控制，防止大量任务同时运行耗尽数据库/Redis连接池
+        self._sem = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
 
     async def execute_with_monitoring(
         self,
@@ -75,42 +182,109 @@ class ProductionScheduler:
         **kwargs
     ):
         """执行任务并记录监控数据"""
-        execution = TaskExecution(
-            task_id=task_id,
-            status="running",
-            started_at=datetime.now()
-        )
-
-        if task_id not in self.execution_history:
-            self.execution_history[task_id] = []
-
-        self.execution_history[task_id].append(execution)
-
-        try:
-            result = await func(*args, **kwargs)
-
-            execution.status = "success"
-            execution.completed_at = datetime.now()
-            execution.duration = (
-                execution.completed_at - execution.started_at
-            ).total_seconds()
-
-            logger.info(
-                f"Task {task_id} completed in {execution.duration:.2f}s"
+        async with self._sem:
+            # 耗时用单调时钟计算，不受系统时间调整影响
+            t0 = time.perf_counter()
+            execution = _Exec(
+                task_id=task_id,
+                status="running",
+                started_at=datetime.now(timezone.utc)
             )
 
-            return result
-
-        except Exception as e:
-            execution.status = "failed"
-            execution.completed_at = datetime.now()
-            execution.duration = (
-                execution.completed_at - execution.started_at
-            ).total_seconds()
-            execution.error = str(e)
-
-            logger.error(f"Task {task_id} failed: {e}")
-            raise
+            self.execution_history[task_id].append(execution)
+
+            try:
+                result = await func(*args, **kwargs)
+
+                execution.status = "success"
+                execution.duration = time.perf_counter() - t0
+                execution.completed_at = datetime.now(timezone.utc)
+
+                logger.info(
+                    "Task %s completed in %.2fs", task_id, execution.duration
+                )
+
+                return result
+
+            except Exception as e:
+                execution.status = "failed"
+                execution.duration = time.perf_counter() - t0
+                execution.completed_at = datetime.now(timezone.utc)
+                execution.error = str(e)
+
+                logger.error("Task %s failed: %s", task_id, e)
+                raise
+
+            finally:
+                # 只入队，落库交给后台批量写入
+                self._exec_queue.put_nowait(execution)
+
+    def _write_batch(self, records: List[_Exec]):
+        """一个事务写入一批执行记录（executemany）"""
+        with self.engine.begin() as conn:
+            conn.execute(_INSERT_EXECUTION, [r.as_params() for r in records])
+
+    async def _flush_loop(self):
+        """后台协程：批量把执行记录写入数据库"""
+        loop = asyncio.get_running_loop()
+        while True:
+            records = [await self._exec_queue.get()]
+            deadline = loop.time() + FLUSH_INTERVAL
+            try:
+                while len(records) < FLUSH_BATCH_SIZE:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        records.append(
+                            await asyncio.wait_for(self._exec_queue.get(), remaining)
+                        )
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # 停止时把已取出、尚未写入的记录写完
+                self._write_batch(records)
+                raise
+
+            try:
+                # 同步驱动放到线程里执行，不阻塞事件循环
+                await asyncio.to_thread(self._write_batch, records)
+            except Exception as e:
+                logger.error("Failed to flush %d executions: %s", len(records), e)
+
+    def _on_job_error(self, event):
+        """任务抛出异常时只入队，不在事件回调里发HTTP请求"""
+        self._alert_queue.put_nowait({
+            "job": event.job_id,
+            "ts": time.time(),
+            "err": repr(event.exception),
+        })
+
+    async def _alert_loop(self):
+        """后台协程：把失败事件攒批后一次性发送"""
+        loop = asyncio.get_running_loop()
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            while True:
+                batch = [await self._alert_queue.get()]
+                deadline = loop.time() + ALERT_BATCH_WINDOW
+                while len(batch) < ALERT_BATCH_SIZE:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(
+                            await asyncio.wait_for(self._alert_queue.get(), remaining)
+                        )
+                    except asyncio.TimeoutError:
+                        break
+
+                if not ALERT_WEBHOOK_URL:
+                    logger.warning("ALERT %d job failures: %s", len(batch), batch)
+                    continue
+                try:
+                    await client.post(ALERT_WEBHOOK_URL, json=batch)
+                except httpx.HTTPError as e:
+                    logger.error("Failed to send %d alerts: %s", len(batch), e)
 
     def get_task_status(self, task_id: str) -> TaskStatus:
         """获取任务状态"""
@@ -122,30 +296,103 @@ class ProductionScheduler:
         return TaskStatus(
             task_id=task_id,
             next_run_time=job.next_run_time,
-            trigger=str(job.trigger),
-            executions=self.execution_history.get(task_id, [])
+            trigger=self._format_trigger(job),
+            executions=[
+                TaskExecution.model_validate(e, from_attributes=True)
+                for e in self.execution_history.get(task_id, ())
+            ]
         )
 
+    def stream_task_status(self, task_id: str) -> Iterator[bytes]:
+        """
+        以msgpack分块流式输出任务状态
+
+        第一块是任务信息，之后每块是最多STREAM_CHUNK_SIZE条执行记录的数组；
+        客户端可用msgpack.Unpacker边收边解析
+        """
+        job = self.scheduler.get_job(task_id)
+
+        if not job:
+            raise HTTPException(status_code=404, detail="Task not found")
+
+        header = {
+            "task_id": task_id,
+            "next_run_time": job.next_run_time,
+            "trigger": self._format_trigger(job),
+        }
+        # 先取快照：生成过程中deque可能被新的执行记录修改
+        executions = list(self.execution_history.get(task_id, ()))
+
+        def gen():
+            yield msgpack.packb(header, datetime=True)
+            for i in range(0, len(executions), STREAM_CHUNK_SIZE):
+                batch = executions[i:i + STREAM_CHUNK_SIZE]
+                yield msgpack.packb(
+                    [e.as_params() for e in batch], datetime=True
+                )
+
+        return gen()
+
+    def _invalidate_list_cache(self, event=None):
+        self._list_cache = (0.0, None)
+        self._trigger_repr.clear()
+
+    def _format_trigger(self, job) -> str:
+        """str(trigger)要格式化时区等信息，按任务缓存"""
+        text = self._trigger_repr.get(job.id)
+        if text is None:
+            text = self._trigger_repr[job.id] = str(job.trigger)
+        return text
+
     def list_tasks(self) -> List[dict]:
-        """列出所有任务"""
+        """列出所有任务（短时缓存）"""
+        now = time.monotonic()
+        ts, cached = self._list_cache
+        if cached is not None and now - ts < LIST_CACHE_TTL:
+            return cached
+
         jobs = self.scheduler.get_jobs()
-        return [
+        tasks = [
             {
                 "id": job.id,
                 "name": job.name,
                 "next_run_time": str(job.next_run_time),
-                "trigger": str(job.trigger)
+                "trigger": self._format_trigger(job)
             }
             for job in jobs
         ]
+        self._list_cache = (now, tasks)
+        return tasks
 
     def start(self):
         """启动调度器"""
+        with self.engine.begin() as conn:
+            conn.execute(_CREATE_EXECUTIONS)
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        self._alert_task = asyncio.create_task(self._alert_loop())
         self.scheduler.start()
         logger.info("Production scheduler started")
 
+    async def stop(self):
+        """停止调度器，并把队列里剩余的记录写完"""
+        self.scheduler.shutdown()
+        if self._alert_task:
+            self._alert_task.cancel()
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        records = []
+        while not self._exec_queue.empty():
+            records.append(self._exec_queue.get_nowait())
+        if records:
+            self._write_batch(records)
+
 # FastAPI应用
-app = FastAPI(title="定时任务监控系统")
+# orjson原生序列化datetime，执行记录多时比标准库json快得多
+app = FastAPI(title="定时任务监控系统", default_response_class=ORJSONResponse)
 scheduler = ProductionScheduler()
 
 # 示例任务
@@ -161,6 +408,14 @@ async def cache_warmup_task():
     await asyncio.sleep(0.5)
     logger.info("Cache warmed up")
 
+# 调度入口：SQLAlchemyJobStore要把任务pickle进数据库，
+# 回调必须是可按"模块:函数名"引用的模块级函数，不能用lambda
+async def _run_data_report():
+    await scheduler.execute_with_monitoring("data_report", data_report_task)
+
+async def _run_cache_warmup():
+    await scheduler.execute_with_monitoring("cache_warmup", cache_warmup_task)
+
 # Endpoints
 @app.get("/")
 async def root():
@@ -175,7 +430,13 @@ async def list_tasks():
     return scheduler.list_tasks()
 
 @app.get("/api/tasks/{task_id}")
-async def get_task_status(task_id: str):
+async def get_task_status(task_id: str, request: Request):
+    # 客户端声明接受msgpack时流式返回，浏览器等默认走JSON
+    if "application/msgpack" in request.headers.get("accept", ""):
+        return StreamingResponse(
+            scheduler.stream_task_status(task_id),
+            media_type="application/msgpack"
+        )
     return scheduler.get_task_status(task_id)
 
 @app.delete("/api/tasks/{task_id}")
@@ -186,33 +447,39 @@ async def delete_task(task_id: str):
 # 应用生命周期
 @app.on_event("startup")
 async def startup_event():
+    # replace_existing：重启后覆盖库里已持久化的同名任务，避免重复
     scheduler.scheduler.add_job(
-        lambda: scheduler.execute_with_monitoring(
-            "data_report",
-            data_report_task
-        ),
+        _run_data_report,
         'interval',
         seconds=30,
         id='data_report',
-        name='数据报表'
+        name='数据报表',
+        replace_existing=True
     )
 
     scheduler.scheduler.add_job(
-        lambda: scheduler.execute_with_monitoring(
-            "cache_warmup",
-            cache_warmup_task
-        ),
+        _run_cache_warmup,
         'interval',
         seconds=45,
         id='cache_warmup',
-        name='缓存预热'
+        name='缓存预热',
+        replace_existing=True
     )
 
     scheduler.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    scheduler.scheduler.shutdown()
+    await scheduler.stop()
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvloop + httptools（uvicorn[standard]自带）；关闭访问日志减少每请求开销
+    # 注意：调度器和执行历史都在进程内，只能单worker运行
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        access_log=False,
+    )
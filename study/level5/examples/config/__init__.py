@@ -0,0 +1,44 @@
+# ========================================
+# 配置包
+# ========================================
+# 说明：根据 ENVIRONMENT 环境变量选择对应环境的配置
+# development（默认） / staging / production
+# ========================================
+
+import os
+from functools import lru_cache
+
+from .base import Settings
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """获取当前环境的配置（首次调用时加载并校验，之后复用同一个实例）"""
+    env = os.getenv("ENVIRONMENT", "development").lower()
+
+    if env == "production":
+        from .production import ProductionSettings
+        return ProductionSettings()
+    if env == "staging":
+        from .staging import StagingSettings
+        return StagingSettings()
+    from .development import DevelopmentSettings
+    return DevelopmentSettings()
+
+
+# ========================================
+# 使用方式
+# ========================================
+#
+# 1. 直接获取：
+#    from config import get_settings
+#    settings = get_settings()
+#
+# 2. 在 FastAPI 中作为依赖注入（测试时可覆盖）：
+#    @app.get("/info")
+#    async def info(settings: Settings = Depends(get_settings)):
+#        return {"app_name": settings.APP_NAME}
+#
+#    app.dependency_overrides[get_settings] = lambda: Settings(DEBUG=True)
+#
+# ========================================
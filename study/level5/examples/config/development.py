@@ -9,7 +9,7 @@
 # 4. 禁用限流和缓存
 # ========================================
 
-from config.base import Settings
+from config.base import LogLevel, Settings
 
 
 class DevelopmentSettings(Settings):
@@ -19,7 +19,7 @@ class DevelopmentSettings(Settings):
     # 应用配置
     # ----------------------------------------
     DEBUG: bool = True  # 启用调试模式
-    LOG_LEVEL: str = "DEBUG"  # 详细日志
+    LOG_LEVEL: LogLevel = "DEBUG"  # 详细日志
 
     # ----------------------------------------
     # 数据库配置（本地开发数据库）
@@ -41,12 +41,12 @@ class DevelopmentSettings(Settings):
     # ----------------------------------------
     # CORS 配置（允许所有源）
     # ----------------------------------------
-    CORS_ALLOW_ORIGINS: list[str] = [
+    CORS_ALLOW_ORIGINS: frozenset[str] = frozenset({
         "http://localhost:3000",  # React Dev Server
         "http://localhost:8000",  # FastAPI
         "http://127.0.0.1:3000",
         "http://127.0.0.1:8000",
-    ]
+    })
     CORS_ALLOW_CREDENTIALS: bool = True
 
     # ----------------------------------------
@@ -95,15 +95,14 @@ class DevelopmentSettings(Settings):
 
 
 # ========================================
-# 创建配置实例
+# 获取配置实例
 # ========================================
-# 使用方式：
-# from config.development import settings
+# 使用方式（ENVIRONMENT=development）：
+# from config import get_settings
+# settings = get_settings()
 # print(settings.APP_NAME)
 # ========================================
 
-settings = DevelopmentSettings()
-
 
 # ========================================
 # 使用说明
@@ -9,7 +9,7 @@
 # 4. 启用监控和告警
 # ========================================
 
-from config.base import Settings
+from config.base import JwtAlgorithm, LogLevel, Settings
 
 
 class StagingSettings(Settings):
@@ -19,7 +19,7 @@ class StagingSettings(Settings):
     # 应用配置
     # ----------------------------------------
     DEBUG: bool = False  # 关闭调试模式
-    LOG_LEVEL: str = "INFO"  # 信息日志
+    LOG_LEVEL: LogLevel = "INFO"  # 信息日志
 
     # ----------------------------------------
     # 数据库配置（预发数据库）
@@ -39,17 +39,17 @@ class StagingSettings(Settings):
     # 安全配置（使用强密钥）
     # ----------------------------------------
     SECRET_KEY: str = "CHANGE_THIS_IN_STAGING_ENVIRONMENT_AT_LEAST_32_CHARS"
-    ALGORITHM: str = "HS256"
+    ALGORITHM: JwtAlgorithm = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
 
     # ----------------------------------------
     # CORS 配置（仅允许预发域名）
     # ----------------------------------------
-    CORS_ALLOW_ORIGINS: list[str] = [
+    CORS_ALLOW_ORIGINS: frozenset[str] = frozenset({
         "https://staging.example.com",
         "https://www.staging.example.com",
-    ]
+    })
     CORS_ALLOW_CREDENTIALS: bool = True
 
     # ----------------------------------------
@@ -110,15 +110,14 @@ class StagingSettings(Settings):
 
 
 # ========================================
-# 创建配置实例
+# 获取配置实例
 # ========================================
-# 使用方式：
-# from config.staging import settings
+# 使用方式（ENVIRONMENT=staging）：
+# from config import get_settings
+# settings = get_settings()
 # print(settings.APP_NAME)
 # ========================================
 
-settings = StagingSettings()
-
 
 # ========================================
 # 使用说明
@@ -5,46 +5,171 @@
 # 包含：配置加载、数据库连接、Redis 缓存、健康检查
 # ========================================
 
-from fastapi import FastAPI, Request, status
+from fastapi import Depends, FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
+from functools import lru_cache
+import asyncio
 import logging
-from typing import Optional
+import logging.config
+import logging.handlers
+import os
+import queue
+import sys
+from time import perf_counter_ns
+from typing import Optional, Protocol
+
+import orjson
+
+
+class AppSettings(Protocol):
+    """main.py 用到的配置字段（config.Settings 与 DefaultSettings 都完整提供）"""
+
+    APP_NAME: str
+    DEBUG: bool
+    APP_VERSION: str
+    LOG_LEVEL: str
+    LOG_FORMAT: str
+    LOG_FILE: Optional[str]
+    LOG_MAX_BYTES: int
+    LOG_BACKUP_COUNT: int
+    LOG_JSON: bool
+    SLOW_REQUEST_MS: int
+    HOST: str
+    PORT: int
+    WORKERS: int
+    CORS_ENABLED: bool
+    CORS_ALLOW_ORIGINS: frozenset[str]
+    CORS_ALLOW_CREDENTIALS: bool
+    CORS_ALLOW_METHODS: tuple[str, ...]
+    CORS_ALLOW_HEADERS: tuple[str, ...]
+
 
 class DefaultSettings:
+    """未加载到 config 包时的默认配置，字段与 AppSettings 一一对应"""
+
     APP_NAME: str = "FastAPI Application"
     DEBUG: bool = False
-    VERSION: str = "1.0.0"
+    APP_VERSION: str = "1.0.0"
     LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    LOG_FILE: Optional[str] = None
+    LOG_MAX_BYTES: int = 10485760
+    LOG_BACKUP_COUNT: int = 5
+    LOG_JSON: bool = False
+    SLOW_REQUEST_MS: int = 50
     HOST: str = "0.0.0.0"
     PORT: int = 8000
     WORKERS: int = 1
     CORS_ENABLED: bool = True
-    CORS_ALLOW_ORIGINS: list[str] = ["*"]
+    CORS_ALLOW_ORIGINS: frozenset[str] = frozenset({"*"})
     CORS_ALLOW_CREDENTIALS: bool = True
-    CORS_ALLOW_METHODS: list[str] = ["*"]
-    CORS_ALLOW_HEADERS: list[str] = ["*"]
+    CORS_ALLOW_METHODS: tuple[str, ...] = ("*",)
+    CORS_ALLOW_HEADERS: tuple[str, ...] = ("*",)
 
 
-# 尝试导入配置（优先包内相对导入，其次脚本路径导入）
-settings = DefaultSettings()
-try:
+@lru_cache(maxsize=1)
+def get_app_settings() -> AppSettings:
+    """
+    获取应用配置（只加载一次）
+
+    路由通过 Depends(get_app_settings) 使用，测试时可用
+    app.dependency_overrides[get_app_settings] 替换
+    """
     try:
-        from .config.base import Settings  # type: ignore
-    except ImportError:
-        from config.base import Settings  # type: ignore
-
-    settings = Settings()
-except Exception:
-    # 示例代码在未配置 .env 或校验失败时退回默认配置，保证学习可运行
-    settings = DefaultSettings()
-
-# 配置日志
-logging.basicConfig(
-    level=getattr(logging, settings.LOG_LEVEL.upper() if hasattr(settings, 'LOG_LEVEL') else 'INFO'),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+        # 优先包内相对导入，其次脚本路径导入
+        try:
+            from .config import get_settings  # type: ignore
+        except ImportError:
+            from config import get_settings  # type: ignore
+
+        return get_settings()
+    except Exception:
+        # 生产/预发环境配置错误必须让进程启动失败，不能带着默认配置悄悄上线
+        if os.getenv("ENVIRONMENT", "development").lower() != "development":
+            raise
+        # 开发环境在未配置 .env 或校验失败时退回默认配置，保证学习可运行
+        return DefaultSettings()
+
+
+settings: AppSettings = get_app_settings()
+
+# ----------------------------------------
+# 日志配置（队列异步写出）
+# ----------------------------------------
+class JsonFormatter(logging.Formatter):
+    """单行 JSON 日志（orjson 序列化），ELK 等可直接采集，无需 grok 解析"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": record.created,
+            "lvl": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "path": record.pathname,
+            "line": record.lineno,
+            "rid": getattr(record, "request_id", None),
+        }
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return orjson.dumps(payload).decode()
+
+
+def build_log_listener(queue_: queue.SimpleQueue, settings: AppSettings) -> logging.handlers.QueueListener:
+    """
+    创建日志监听器：在后台线程中格式化并写出日志
+
+    输出到 stdout，配置了 LOG_FILE 时同时写入轮转文件
+    """
+    formatter = JsonFormatter() if settings.LOG_JSON else logging.Formatter(settings.LOG_FORMAT)
+    handlers: list[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+    if settings.LOG_FILE:
+        os.makedirs(os.path.dirname(settings.LOG_FILE) or ".", exist_ok=True)
+        handlers.append(logging.handlers.RotatingFileHandler(
+            settings.LOG_FILE,
+            maxBytes=settings.LOG_MAX_BYTES,
+            backupCount=settings.LOG_BACKUP_COUNT,
+            encoding="utf-8",
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return logging.handlers.QueueListener(queue_, *handlers, respect_handler_level=True)
+
+
+# 日志级别在模块加载时解析一次（Settings 的验证器已统一为大写）
+LOG_LEVEL = settings.LOG_LEVEL.upper()
+
+# 根日志器只挂 QueueHandler：请求路径上只做入队，格式化和 I/O 由监听器线程完成
+# 监听器在 lifespan 启动前产生的日志会先留在队列中，启动后一并写出
+log_queue: queue.SimpleQueue = queue.SimpleQueue()
+LOGGING_CONFIG = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        # 入队时只合并 msg 与 args，完整格式留给监听器端的 formatter
+        "message": {"format": "%(message)s"},
+    },
+    "handlers": {
+        "queue": {
+            "()": logging.handlers.QueueHandler,
+            "queue": log_queue,
+            "formatter": "message",
+        },
+    },
+    "root": {"level": LOG_LEVEL, "handlers": ["queue"]},
+}
+
+# 模块被重复导入（如 Gunicorn 预加载后 worker 再导入）时不重复配置，
+# 否则根日志器会挂上多个 handler，每条日志输出多次
+_root_logger = logging.getLogger()
+if not _root_logger.handlers:
+    logging.config.dictConfig(LOGGING_CONFIG)
+# 复用已安装的队列，保证 lifespan 中的监听器消费的是根日志器写入的那个队列
+for _handler in _root_logger.handlers:
+    if isinstance(_handler, logging.handlers.QueueHandler):
+        log_queue = _handler.queue
+        break
 logger = logging.getLogger(__name__)
 
 # ----------------------------------------
@@ -54,8 +179,13 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     """应用启动和关闭时的操作"""
     # 启动时执行
-    logger.info(f"🚀 Starting {settings.APP_NAME} v{settings.VERSION}")
+    log_listener = build_log_listener(log_queue, settings)
+    log_listener.start()
+
+    logger.info(f"🚀 Starting {settings.APP_NAME} v{settings.APP_VERSION}")
     logger.info(f"📝 Debug mode: {settings.DEBUG}")
+    # 确认运行在 uvloop 上（直接 python main.py 或 uvicorn --loop uvloop 启动时）
+    logger.info("Event loop: %s", type(asyncio.get_running_loop()).__module__)
 
     # 这里可以连接数据库、Redis 等
     # await database.connect()
@@ -68,28 +198,33 @@ async def lifespan(app: FastAPI):
     # await database.disconnect()
     # await redis.close()
 
+    # 最后停止日志监听器（会先写完队列中剩余的日志）
+    log_listener.stop()
+
 
 # ----------------------------------------
 # 创建 FastAPI 应用
 # ----------------------------------------
 app = FastAPI(
     title=settings.APP_NAME,
-    version=settings.VERSION,
+    version=settings.APP_VERSION,
     description="Production-ready FastAPI Application",
     debug=settings.DEBUG,
+    # 所有端点默认用 orjson 序列化响应
+    default_response_class=ORJSONResponse,
     lifespan=lifespan,
 )
 
 # ----------------------------------------
 # CORS 配置
 # ----------------------------------------
-if hasattr(settings, 'CORS_ENABLED') and settings.CORS_ENABLED:
+if settings.CORS_ENABLED:
     app.add_middleware(
         CORSMiddleware,
-        allow_origins=getattr(settings, 'CORS_ALLOW_ORIGINS', ['*']),
-        allow_credentials=getattr(settings, 'CORS_ALLOW_CREDENTIALS', True),
-        allow_methods=getattr(settings, 'CORS_ALLOW_METHODS', ['*']),
-        allow_headers=getattr(settings, 'CORS_ALLOW_HEADERS', ['*']),
+        allow_origins=settings.CORS_ALLOW_ORIGINS,
+        allow_credentials=settings.CORS_ALLOW_CREDENTIALS,
+        allow_methods=settings.CORS_ALLOW_METHODS,
+        allow_headers=settings.CORS_ALLOW_HEADERS,
     )
 
 
@@ -100,7 +235,7 @@ if hasattr(settings, 'CORS_ENABLED') and settings.CORS_ENABLED:
 async def global_exception_handler(request: Request, exc: Exception):
     """全局异常处理器"""
     logger.error(f"Unhandled exception: {exc}", exc_info=True)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={
             "message": "Internal server error",
@@ -113,11 +248,11 @@ async def global_exception_handler(request: Request, exc: Exception):
 # 根路径
 # ----------------------------------------
 @app.get("/")
-async def root():
+async def root(settings: AppSettings = Depends(get_app_settings)):
     """根路径"""
     return {
         "message": f"Welcome to {settings.APP_NAME}",
-        "version": settings.VERSION,
+        "version": settings.APP_VERSION,
         "status": "running"
     }
 
@@ -126,11 +261,11 @@ async def root():
 # 健康检查端点（用于 Kubernetes 探针）
 # ----------------------------------------
 @app.get("/health")
-async def health_check():
+async def health_check(settings: AppSettings = Depends(get_app_settings)):
     """健康检查（Liveness 和 Readiness 探针）"""
     return {
         "status": "healthy",
-        "version": settings.VERSION
+        "version": settings.APP_VERSION
     }
 
 
@@ -153,14 +288,14 @@ async def readiness_check():
 # 配置信息端点（开发环境）
 # ----------------------------------------
 @app.get("/config")
-async def get_config():
+async def get_config(settings: AppSettings = Depends(get_app_settings)):
     """获取配置信息（仅开发环境）"""
     if not settings.DEBUG:
         return {"message": "Config endpoint is disabled in production"}
 
     return {
         "app_name": settings.APP_NAME,
-        "version": settings.VERSION,
+        "version": settings.APP_VERSION,
         "debug": settings.DEBUG,
         # 不要暴露敏感信息（密码、密钥等）
     }
@@ -195,27 +330,30 @@ async def get_user(user_id: int):
 # ----------------------------------------
 # 中间件：请求日志
 # ----------------------------------------
+# 慢请求阈值（纳秒），模块加载时换算一次
+SLOW_REQUEST_NS = settings.SLOW_REQUEST_MS * 1_000_000
+
+
 @app.middleware("http")
-async def log_requests(request: Request, call_next):
-    """记录所有请求"""
-    import time
-    start_time = time.time()
+async def log_requests(request: Request, call_next, _now=perf_counter_ns):
+    """记录慢请求和错误请求（正常的快请求不打日志）"""
+    # _now 绑定为默认参数：调用时是局部变量读取，不再查找模块全局
+    t0 = _now()
 
     # 处理请求
     response = await call_next(request)
 
-    # 计算处理时间
-    process_time = time.time() - start_time
+    # 计算处理时间（单调时钟，不受系统时间调整影响）
+    dt_ns = _now() - t0
 
-    # 记录日志
-    logger.info(
-        f"{request.method} {request.url.path} "
-        f"- Status: {response.status_code} "
-        f"- Time: {process_time:.3f}s"
-    )
+    # 添加响应头（毫秒）
+    response.headers["X-Process-Time"] = f"{dt_ns / 1e6:.3f}"
 
-    # 添加响应头
-    response.headers["X-Process-Time"] = str(process_time)
+    if dt_ns >= SLOW_REQUEST_NS or response.status_code >= 400:
+        logger.warning(
+            "%s %s - Status: %d - Time: %.3fms",
+            request.method, request.url.path, response.status_code, dt_ns / 1e6,
+        )
 
     return response
 
@@ -228,11 +366,14 @@ if __name__ == "__main__":
 
     uvicorn.run(
         "main:app",
-        host=getattr(settings, 'HOST', '0.0.0.0'),
-        port=getattr(settings, 'PORT', 8000),
+        host=settings.HOST,
+        port=settings.PORT,
         reload=settings.DEBUG,  # 开发环境自动重载
-        workers=getattr(settings, 'WORKERS', 1),
-        log_level=settings.LOG_LEVEL.lower() if hasattr(settings, 'LOG_LEVEL') else 'info'
+        workers=settings.WORKERS,
+        log_level=LOG_LEVEL.lower(),
+        # uvloop（libuv 事件循环）+ httptools（C 实现的 HTTP 解析器），均随 uvicorn[standard] 安装
+        loop="uvloop",
+        http="httptools",
     )
 
 # ========================================
@@ -244,7 +385,7 @@ if __name__ == "__main__":
 #    uvicorn main:app --reload --host 0.0.0.0 --port 8000
 #
 #    # 生产环境
-#    uvicorn main:app --host 0.0.0.0 --port 8000 --workers 4
+#    uvicorn main:app --host 0.0.0.0 --port 8000 --workers 4 --loop uvloop --http httptools
 #
 # 2. 访问 API 文档：
 #    http://localhost:8000/docs
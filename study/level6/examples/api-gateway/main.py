@@ -1,9 +1,30 @@
-from fastapi import FastAPI, Request, HTTPException
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
+import orjson
 import uvicorn
 
-app = FastAPI(title="API Gateway")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 全局共享一个客户端：复用到后端服务的 keep-alive 连接，避免每个请求重新建连
+    # retries 只重试建立连接失败的情况
+    app.state.http = httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(
+            retries=3,
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+        ),
+        timeout=httpx.Timeout(30.0, connect=5.0),
+    )
+    yield
+    await app.state.http.aclose()
+
+
+app = FastAPI(title="API Gateway", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # CORS 中间件
 app.add_middleware(
@@ -20,9 +41,27 @@ services = {
     "products": "http://product-service:8000",
 }
 
+# 逐跳（hop-by-hop）头只对单条连接有效，代理时不能原样转发
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade",
+})
+
+
+def _forward_headers(headers, drop=frozenset()) -> dict:
+    """过滤掉逐跳头（以及额外指定的头）"""
+    return {
+        k: v for k, v in headers.items()
+        if k.lower() not in HOP_BY_HOP_HEADERS and k.lower() not in drop
+    }
+
+
+# 健康检查响应固定不变：导入时序列化一次，探针请求直接返回字节
+_HEALTH_BYTES = orjson.dumps({"status": "healthy", "service": "api-gateway"})
+
 @app.get("/health")
-def health_check():
-    return {"status": "healthy", "service": "api-gateway"}
+async def health_check():
+    return Response(content=_HEALTH_BYTES, media_type="application/json")
 
 @app.api_route("/api/{service}/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
 async def proxy_request(service: str, path: str, request: Request):
@@ -33,22 +72,29 @@ async def proxy_request(service: str, path: str, request: Request):
     service_url = services[service]
     url = f"{service_url}/{path}"
 
-    # 转发请求
+    # 转发请求（Host 由 httpx 按后端地址设置）
     body = await request.body()
-    headers = dict(request.headers)
-
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.request(
-                method=request.method,
-                url=url,
-                headers=headers,
-                content=body,
-                timeout=30.0
-            )
-            return response.json()
-        except httpx.HTTPError as e:
-            raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
+    headers = _forward_headers(request.headers, drop={"host"})
+
+    client: httpx.AsyncClient = request.app.state.http
+    upstream_request = client.build_request(
+        request.method,
+        url,
+        headers=headers,
+        content=body,
+    )
+    try:
+        response = await client.send(upstream_request, stream=True)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
+
+    # 原样流式透传响应字节，不解析 JSON；发送完毕后关闭上游响应
+    return StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        headers=_forward_headers(response.headers),
+        background=BackgroundTask(response.aclose),
+    )
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
@@ -10,27 +10,55 @@
 - 长时间运行的异步任务
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-import aioredis
+from redis import asyncio as aioredis  # redis-py 4.2+ 内置异步客户端（原 aioredis 已并入）
 import asyncio
+import msgspec
 import uuid
 import time
-import json
 import os
-from typing import Optional, Dict, Any
+from typing import Any, Callable, Dict, NamedTuple, Optional
 from datetime import datetime
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # 配置
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 SERVICE_NAME = os.getenv("SERVICE_NAME", "unknown")
 
+# 任务执行：固定数量的 worker 从队列取任务，限制并发，队列满时拒绝新任务
+TASK_WORKERS = int(os.getenv("TASK_WORKERS", 8))
+TASK_QUEUE_SIZE = int(os.getenv("TASK_QUEUE_SIZE", 1000))
+
+# 状态写入合并窗口：窗口内各任务的保存合成一个管道批量写入
+# 以最多几毫秒的额外写延迟换取更少的 Redis 往返，设为 0 则只合并同一时刻的写入
+WRITE_COALESCE_MS = float(os.getenv("WRITE_COALESCE_MS", 5))
+
 # Redis 连接
 redis_client = None
 
+
+class TaskState(msgspec.Struct, kw_only=True):
+    """任务状态（字段固定，比嵌套 dict 更省内存，编解码也更快）"""
+    task_id: str
+    status: str
+    graph_name: str
+    state: Dict[str, Any]
+    progress: int = 0
+    current_node: str = "start"
+    checkpoint: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+
+# 任务状态用 MessagePack 序列化（比 JSON 更快、更小），编解码器只创建一次
+_encoder = msgspec.msgpack.Encoder()
+_decoder = msgspec.msgpack.Decoder(TaskState)
+
 # 模拟 LangGraph 图定义
 LANGGRAPH_GRAPHS = {
     "data_pipeline": {
@@ -51,15 +79,42 @@ LANGGRAPH_GRAPHS = {
     }
 }
 
+# 预计算：检查点 -> 下一个节点（图定义在导入后不再变化）
+for _graph in LANGGRAPH_GRAPHS.values():
+    _graph["next_after_checkpoint"] = {
+        f"{from_node}_completed": to_node for from_node, to_node in _graph["edges"]
+    }
+
+# 模拟节点定义：节点名 -> (执行耗时秒数, 结果写入的 state 键, 结果生成函数, 完成后的进度)
+class NodeSpec(NamedTuple):
+    duration: float
+    output_key: str
+    output: Callable[[], Any]
+    progress: int
+
+NODE_HANDLERS: Dict[str, NodeSpec] = {
+    "fetch": NodeSpec(5, "data", lambda: f"fetched_data_{time.time()}", 10),
+    "transform": NodeSpec(10, "transformed", lambda: f"transformed_{time.time()}", 40),
+    "validate": NodeSpec(3, "validated", lambda: True, 60),
+    "save": NodeSpec(2, "saved", lambda: True, 80),
+    "load_data": NodeSpec(5, "data", lambda: f"loaded_data_{time.time()}", 10),
+    "preprocess": NodeSpec(8, "preprocessed", lambda: f"preprocessed_{time.time()}", 30),
+    "train": NodeSpec(15, "model", lambda: f"model_{time.time()}", 60),
+    "evaluate": NodeSpec(5, "accuracy", lambda: 0.95, 90),
+}
+
 async def get_redis():
     """获取 Redis 连接"""
     global redis_client
     if redis_client is None:
-        redis_client = await aioredis.from_url(
+        # 显式配置连接池：上限按 worker 并发留余量，定期探活避免用到失效连接
+        # 任务状态是二进制的 msgpack，不自动解码为字符串
+        pool = aioredis.ConnectionPool.from_url(
             f"redis://{REDIS_HOST}:{REDIS_PORT}",
-            encoding="utf-8",
-            decode_responses=True
+            max_connections=max(32, TASK_WORKERS * 4),
+            health_check_interval=30
         )
+        redis_client = aioredis.Redis(connection_pool=pool)
     return redis_client
 
 # 数据模型
@@ -78,30 +133,94 @@ class TaskStateManager:
     
     def __init__(self):
         self.redis = None
+        # 等待合并写入的状态：task_id -> 编码后的字节（同一任务只保留最新一次）
+        self.pending_writes: Dict[str, bytes] = {}
+        self.flush_event = asyncio.Event()
+        self._batch_done: Optional[asyncio.Future] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._closing = False
     
     async def init(self):
-        """初始化 Redis 连接"""
+        """初始化 Redis 连接，启动后台合并写入协程"""
         self.redis = await get_redis()
-    
-    async def save_task_state(self, task_id: str, state: dict):
-        """保存任务状态到 Redis"""
-        key = f"task:{task_id}"
-        await self.redis.setex(
-            key,
-            86400,  # 24 小时过期
-            json.dumps(state)
+        self._closing = False
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._run_flusher())
+    
+    async def close(self):
+        """停止合并写入协程，并把尚未写出的状态写入 Redis"""
+        if self._flusher is not None:
+            # 不直接 cancel：正在写出的批次已从 pending_writes 取出，取消会丢失这一批
+            # 且等待者永远等不到结果；设置停止标志，让协程写完当前批次后自行退出
+            self._closing = True
+            self.flush_event.set()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self._flush()
+    
+    async def save_task_state(self, task_id: str, state: TaskState):
+        """保存任务状态到 Redis（登记到当前批次，等这一批写入完成后返回）"""
+        # 立即编码：state 之后还会被修改，批次里保存的是此刻的快照
+        self.pending_writes[task_id] = _encoder.encode(state)
+        if self._batch_done is None:
+            self._batch_done = asyncio.get_running_loop().create_future()
+        batch_done = self._batch_done
+        self.flush_event.set()
+        # shield：调用方被取消时不影响同一批次的其他等待者
+        await asyncio.shield(batch_done)
+
+    async def _run_flusher(self):
+        """后台协程：有写入时等待一个合并窗口，再把整批状态一次写出；close 时写完当前批次退出"""
+        while not self._closing:
+            await self.flush_event.wait()
+            if not self._closing:
+                await asyncio.sleep(WRITE_COALESCE_MS / 1000)
+            await self._flush()
+
+    async def _flush(self):
+        """取出当前批次写入 Redis，并通知这一批的所有等待者"""
+        self.flush_event.clear()
+        pending, self.pending_writes = self.pending_writes, {}
+        batch_done, self._batch_done = self._batch_done, None
+        try:
+            await self._write_encoded(pending)
+        except Exception as e:
+            if batch_done is not None:
+                batch_done.set_exception(e)
+                # 等待者可能都已取消，避免 "exception was never retrieved" 警告
+                batch_done.exception()
+        else:
+            if batch_done is not None:
+                batch_done.set_result(None)
+
+    async def save_many(self, states: Dict[str, TaskState]):
+        """批量保存任务状态（一个事务管道，一次往返，不经过合并窗口）"""
+        await self._write_encoded(
+            {task_id: _encoder.encode(state) for task_id, state in states.items()}
         )
-        
-        # 保存到任务列表
-        await self.redis.sadd("tasks:all", task_id)
-        await self.redis.expire("tasks:all", 86400)
-    
-    async def load_task_state(self, task_id: str) -> Optional[dict]:
+
+    async def _write_encoded(self, encoded: Dict[str, bytes]):
+        """SETEX 每个任务 + 一次 SADD/EXPIRE 任务列表，整批一次往返"""
+        if not encoded:
+            return
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for task_id, data in encoded.items():
+                pipe.setex(
+                    f"task:{task_id}",
+                    86400,  # 24 小时过期
+                    data
+                )
+            # 保存到任务列表
+            pipe.sadd("tasks:all", *encoded)
+            pipe.expire("tasks:all", 86400)
+            await pipe.execute()
+    
+    async def load_task_state(self, task_id: str) -> Optional[TaskState]:
         """从 Redis 加载任务状态"""
         key = f"task:{task_id}"
         data = await self.redis.get(key)
         if data:
-            return json.loads(data)
+            return _decoder.decode(data)
         return None
     
     async def delete_task_state(self, task_id: str):
@@ -111,19 +230,25 @@ class TaskStateManager:
         await self.redis.srem("tasks:all", task_id)
     
     async def list_all_tasks(self) -> list:
-        """列出所有任务"""
+        """列出所有任务（SMEMBERS + 一次 MGET，共 2 次往返）"""
         task_ids = await self.redis.smembers("tasks:all")
-        tasks = []
-        for task_id in task_ids:
-            state = await self.load_task_state(task_id)
-            if state:
-                tasks.append({
-                    "task_id": state["task_id"],
-                    "status": state["status"],
-                    "progress": state["progress"],
-                    "created_at": state["created_at"]
-                })
-        return tasks
+        if not task_ids:
+            return []
+
+        # 一次 MGET 取回所有任务状态，不再每个任务一次 GET
+        keys = [b"task:" + task_id for task_id in task_ids]
+        raw = await self.redis.mget(keys)
+        # 已过期的任务返回 None，跳过
+        states = [_decoder.decode(data) for data in raw if data]
+        return [
+            {
+                "task_id": state.task_id,
+                "status": state.status,
+                "progress": state.progress,
+                "created_at": state.created_at
+            }
+            for state in states
+        ]
 
 # 任务状态管理器
 task_manager = TaskStateManager()
@@ -132,72 +257,24 @@ task_manager = TaskStateManager()
 async def execute_node(
     task_id: str,
     node_name: str,
-    state: dict,
+    state: TaskState,
     task_manager: TaskStateManager
-) -> dict:
+) -> TaskState:
     """执行单个节点（模拟 LangGraph 节点）"""
     
     print(f"[{task_id}] Executing node: {node_name}")
     
-    # 更新当前节点
-    state["current_node"] = node_name
-    await task_manager.save_task_state(task_id, state)
+    # 更新当前节点（与进度、检查点一起在节点结束时保存，断点恢复只依赖 checkpoint）
+    state.current_node = node_name
     
-    # 模拟节点执行时间
-    if node_name == "fetch":
-        await asyncio.sleep(5)  # 5 秒
-        state["state"]["data"] = f"fetched_data_{time.time()}"
-        state["checkpoint"] = "fetch_completed"
-    
-    elif node_name == "transform":
-        await asyncio.sleep(10)  # 10 秒
-        state["state"]["transformed"] = f"transformed_{time.time()}"
-        state["checkpoint"] = "transform_completed"
-    
-    elif node_name == "validate":
-        await asyncio.sleep(3)  # 3 秒
-        state["state"]["validated"] = True
-        state["checkpoint"] = "validate_completed"
-    
-    elif node_name == "save":
-        await asyncio.sleep(2)  # 2 秒
-        state["state"]["saved"] = True
-        state["checkpoint"] = "save_completed"
-    
-    elif node_name == "load_data":
-        await asyncio.sleep(5)
-        state["state"]["data"] = f"loaded_data_{time.time()}"
-        state["checkpoint"] = "load_data_completed"
-    
-    elif node_name == "preprocess":
-        await asyncio.sleep(8)
-        state["state"]["preprocessed"] = f"preprocessed_{time.time()}"
-        state["checkpoint"] = "preprocess_completed"
-    
-    elif node_name == "train":
-        await asyncio.sleep(15)
-        state["state"]["model"] = f"model_{time.time()}"
-        state["checkpoint"] = "train_completed"
-    
-    elif node_name == "evaluate":
-        await asyncio.sleep(5)
-        state["state"]["accuracy"] = 0.95
-        state["checkpoint"] = "evaluate_completed"
-    
-    # 更新进度
-    progress_map = {
-        "fetch": 10,
-        "transform": 40,
-        "validate": 60,
-        "save": 80,
-        "load_data": 10,
-        "preprocess": 30,
-        "train": 60,
-        "evaluate": 90
-    }
-    state["progress"] = progress_map.get(node_name, 0)
+    # 模拟节点执行：查表得到耗时、要写入的结果和完成后的进度
+    spec = NODE_HANDLERS[node_name]
+    await asyncio.sleep(spec.duration)
+    state.state[spec.output_key] = spec.output()
+    state.checkpoint = f"{node_name}_completed"
+    state.progress = spec.progress
     
-    # 保存检查点
+    # 保存检查点（每个节点只写一次）
     await task_manager.save_task_state(task_id, state)
     
     print(f"[{task_id}] Node {node_name} completed")
@@ -212,46 +289,37 @@ async def execute_langgraph_task(
     """执行 LangGraph 任务（支持断点恢复）"""
     
     try:
-        # 1. 加载或初始化任务状态
+        # 1. 加载任务状态（创建任务时已写入 queued 状态）
         existing_state = await task_manager.load_task_state(task_id)
         
-        if existing_state:
-            # 从现有状态恢复
-            state = existing_state
-            print(f"[{task_id}] Resuming task from checkpoint: {state.get('checkpoint')}")
-            
-            # 如果任务已完成，直接返回
-            if state["status"] == "completed":
-                return
-            
-            # 如果任务失败了，从头开始
-            if state["status"] == "failed":
-                state = {
-                    "task_id": task_id,
-                    "status": "running",
-                    "graph_name": request.graph_name,
-                    "state": request.initial_state.copy(),
-                    "progress": 0,
-                    "current_node": "start",
-                    "error": None,
-                    "created_at": existing_state["created_at"],
-                    "updated_at": time.time(),
-                    "checkpoint": None
-                }
-        else:
-            # 新任务
-            state = {
-                "task_id": task_id,
-                "status": "running",
-                "graph_name": request.graph_name,
-                "state": request.initial_state.copy(),
-                "progress": 0,
-                "current_node": "start",
-                "error": None,
-                "created_at": time.time(),
-                "updated_at": time.time(),
-                "checkpoint": None
-            }
+        if existing_state is None:
+            # 状态不存在：任务在排队期间被删除
+            print(f"[{task_id}] Task deleted while queued, skipping")
+            return
+        
+        state = existing_state
+        
+        # 如果任务已完成，或在排队期间被取消，直接返回
+        if state.status in ("completed", "cancelled"):
+            print(f"[{task_id}] Task {state.status}, skipping")
+            return
+        
+        if state.checkpoint:
+            print(f"[{task_id}] Resuming task from checkpoint: {state.checkpoint}")
+        if state.status == "queued":
+            state.status = "running"
+        state.updated_at = time.time()
+        
+        # 如果任务失败了，从头开始
+        if state.status == "failed":
+            state = TaskState(
+                task_id=task_id,
+                status="running",
+                graph_name=request.graph_name,
+                state=request.initial_state.copy(),
+                created_at=existing_state.created_at,
+                updated_at=time.time(),
+            )
         
         await task_manager.save_task_state(task_id, state)
         
@@ -261,35 +329,16 @@ async def execute_langgraph_task(
             raise ValueError(f"Unknown graph: {request.graph_name}")
         
         # 3. 确定起始节点（从检查点恢复）
-        start_node = None
-        if state.get("checkpoint"):
-            # 从检查点继续
-            checkpoint = state["checkpoint"]
-            
-            # 查找下一个节点
-            for i, (from_node, to_node) in enumerate(graph["edges"]):
-                if f"{from_node}_completed" == checkpoint:
-                    start_node = to_node
-                    break
-            
-            if not start_node:
-                # 检查点已是最新的节点，从头开始
-                start_node = graph["nodes"][0]
-        else:
-            # 从头开始
-            start_node = graph["nodes"][0]
+        # 检查点对应的下一个节点查预计算的映射；没有检查点或已是最后一个节点时从头开始
+        start_node = graph["next_after_checkpoint"].get(state.checkpoint, graph["nodes"][0])
         
         print(f"[{task_id}] Starting from node: {start_node}")
         
-        # 4. 执行图节点
-        for node in graph["nodes"]:
-            # 跳过已经完成的节点
-            if state.get("checkpoint") and node != start_node:
-                print(f"[{task_id}] Skipping completed node: {node}")
-                continue
-            
+        # 4. 执行图节点（起始节点之前的节点已完成，从起始节点执行到最后）
+        start_idx = graph["nodes"].index(start_node)
+        for node in graph["nodes"][start_idx:]:
             # 检查是否需要暂停
-            if state.get("status") == "paused":
+            if state.status == "paused":
                 print(f"[{task_id}] Task paused at node: {node}")
                 break
             
@@ -297,34 +346,65 @@ async def execute_langgraph_task(
             state = await execute_node(task_id, node, state, task_manager)
         
         # 5. 任务完成
-        if state["status"] == "running":
-            state["status"] = "completed"
-            state["progress"] = 100
-            state["checkpoint"] = "completed"
-            state["updated_at"] = time.time()
+        if state.status == "running":
+            state.status = "completed"
+            state.progress = 100
+            state.checkpoint = "completed"
+            state.updated_at = time.time()
             await task_manager.save_task_state(task_id, state)
             print(f"[{task_id}] Task completed!")
         
     except Exception as e:
         # 6. 任务失败
-        state["status"] = "failed"
-        state["error"] = str(e)
-        state["updated_at"] = time.time()
+        state.status = "failed"
+        state.error = str(e)
+        state.updated_at = time.time()
         await task_manager.save_task_state(task_id, state)
         print(f"[{task_id}] Task failed: {e}")
 
+# 任务队列与 worker
+task_queue: asyncio.Queue = asyncio.Queue(maxsize=TASK_QUEUE_SIZE)
+worker_tasks: list = []
+
+async def task_worker(worker_id: int):
+    """worker：串行执行队列中的任务"""
+    while True:
+        task_id, request = await task_queue.get()
+        try:
+            await execute_langgraph_task(task_id, request, task_manager)
+        except Exception as e:
+            print(f"[worker-{worker_id}] Task {task_id} crashed: {e}")
+        finally:
+            task_queue.task_done()
+
+def enqueue_task(task_id: str, request: TaskRequest):
+    """任务入队；队列已满时直接返回 503，不在请求里等待"""
+    try:
+        task_queue.put_nowait((task_id, request))
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Task queue is full, please retry later")
+
 @app.on_event("startup")
 async def startup_event():
     """应用启动时初始化"""
     await task_manager.init()
-    print(f"Task state manager initialized (Service: {SERVICE_NAME})")
+    for i in range(TASK_WORKERS):
+        worker_tasks.append(asyncio.create_task(task_worker(i)))
+    print(f"Task state manager initialized (Service: {SERVICE_NAME}, workers: {TASK_WORKERS})")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时停止 worker（未完成的任务保留检查点，可通过 resume 继续）"""
+    for task in worker_tasks:
+        task.cancel()
+    await asyncio.gather(*worker_tasks, return_exceptions=True)
+    worker_tasks.clear()
+    # worker 停止后再写出合并窗口里剩余的检查点
+    await task_manager.close()
 
 # API 端点
 @app.post("/api/tasks/execute")
-async def create_task(
-    request: TaskRequest,
-    background_tasks: BackgroundTasks
-) -> TaskResponse:
+async def create_task(request: TaskRequest) -> TaskResponse:
     """创建并执行 LangGraph 任务"""
     
     # 验证图名称
@@ -337,18 +417,28 @@ async def create_task(
     # 生成任务 ID
     task_id = f"task_{uuid.uuid4().hex[:8]}"
     
-    # 启动后台任务
-    background_tasks.add_task(
-        execute_langgraph_task,
-        task_id,
-        request,
-        task_manager
-    )
+    # 入队前先写入 queued 状态：排队期间也能查询、取消刚返回的 task_id
+    now = time.time()
+    await task_manager.save_task_state(task_id, TaskState(
+        task_id=task_id,
+        status="queued",
+        graph_name=request.graph_name,
+        state=request.initial_state.copy(),
+        created_at=now,
+        updated_at=now,
+    ))
+    
+    # 放入任务队列，由 worker 执行；队列已满时删掉刚写入的状态再返回 503
+    try:
+        enqueue_task(task_id, request)
+    except HTTPException:
+        await task_manager.delete_task_state(task_id)
+        raise
     
     return TaskResponse(
         task_id=task_id,
-        status="running",
-        message=f"Task {task_id} started. Graph: {request.graph_name}"
+        status="queued",
+        message=f"Task {task_id} queued. Graph: {request.graph_name}"
     )
 
 @app.get("/api/tasks/{task_id}")
@@ -361,15 +451,15 @@ async def get_task_status(task_id: str):
         raise HTTPException(status_code=404, detail="Task not found")
     
     return {
-        "task_id": state["task_id"],
-        "status": state["status"],
-        "progress": state["progress"],
-        "current_node": state["current_node"],
-        "checkpoint": state["checkpoint"],
-        "error": state["error"],
-        "state": state["state"],
-        "created_at": state["created_at"],
-        "updated_at": state["updated_at"],
+        "task_id": state.task_id,
+        "status": state.status,
+        "progress": state.progress,
+        "current_node": state.current_node,
+        "checkpoint": state.checkpoint,
+        "error": state.error,
+        "state": state.state,
+        "created_at": state.created_at,
+        "updated_at": state.updated_at,
         "node": SERVICE_NAME
     }
 
@@ -382,26 +472,23 @@ async def pause_task(task_id: str):
     if not state:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    if state["status"] != "running":
+    if state.status != "running":
         raise HTTPException(
             status_code=400,
-            detail=f"Task is not running (status: {state['status']})"
+            detail=f"Task is not running (status: {state.status})"
         )
     
-    state["status"] = "paused"
-    state["updated_at"] = time.time()
+    state.status = "paused"
+    state.updated_at = time.time()
     await task_manager.save_task_state(task_id, state)
     
     return {
         "message": f"Task {task_id} paused",
-        "checkpoint": state["checkpoint"]
+        "checkpoint": state.checkpoint
     }
 
 @app.post("/api/tasks/{task_id}/resume")
-async def resume_task(
-    task_id: str,
-    background_tasks: BackgroundTasks
-):
+async def resume_task(task_id: str):
     """恢复任务（从检查点继续）"""
     
     state = await task_manager.load_task_state(task_id)
@@ -409,32 +496,43 @@ async def resume_task(
     if not state:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    if state["status"] not in ["paused", "failed"]:
+    # queued 的任务已在队列中，不能重复入队
+    if state.status not in ["paused", "failed"]:
         raise HTTPException(
             status_code=400,
-            detail=f"Task cannot be resumed (status: {state['status']})"
+            detail=f"Task cannot be resumed (status: {state.status})"
         )
     
+    # 队列已满时先拒绝，省去一次状态写入
+    if task_queue.full():
+        raise HTTPException(status_code=503, detail="Task queue is full, please retry later")
+    
     # 恢复任务（从检查点继续）
-    state["status"] = "running"
-    state["error"] = None
-    state["updated_at"] = time.time()
+    previous_status, previous_error = state.status, state.error
+    state.status = "running"
+    state.error = None
+    state.updated_at = time.time()
     await task_manager.save_task_state(task_id, state)
     
-    # 重新启动后台任务（从断点继续）
-    background_tasks.add_task(
-        execute_langgraph_task,
-        task_id,
-        TaskRequest(
-            graph_name=state["graph_name"],
-            initial_state=state["state"]
-        ),
-        task_manager
-    )
+    # 重新入队（从断点继续）；保存期间队列可能已被占满，
+    # 此时把状态改回去，否则任务停在 running 且再也无法恢复
+    try:
+        enqueue_task(
+            task_id,
+            TaskRequest(
+                graph_name=state.graph_name,
+                initial_state=state.state
+            )
+        )
+    except HTTPException:
+        state.status, state.error = previous_status, previous_error
+        state.updated_at = time.time()
+        await task_manager.save_task_state(task_id, state)
+        raise
     
     return {
         "message": f"Task {task_id} resumed",
-        "checkpoint": state["checkpoint"]
+        "checkpoint": state.checkpoint
     }
 
 @app.post("/api/tasks/{task_id}/cancel")
@@ -446,14 +544,14 @@ async def cancel_task(task_id: str):
     if not state:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    if state["status"] not in ["running", "paused"]:
+    if state.status not in ["queued", "running", "paused"]:
         raise HTTPException(
             status_code=400,
-            detail=f"Task cannot be cancelled (status: {state['status']})"
+            detail=f"Task cannot be cancelled (status: {state.status})"
         )
     
-    state["status"] = "cancelled"
-    state["updated_at"] = time.time()
+    state.status = "cancelled"
+    state.updated_at = time.time()
     await task_manager.save_task_state(task_id, state)
     
     return {"message": f"Task {task_id} cancelled"}
@@ -467,7 +565,7 @@ async def delete_task(task_id: str):
     if not state:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    if state["status"] == "running":
+    if state.status == "running":
         raise HTTPException(
             status_code=400,
             detail="Cannot delete running task. Please cancel it first."
@@ -500,15 +598,18 @@ async def list_graphs():
         ]
     }
 
-@app.get("/health")
-async def health_check():
-    """健康检查"""
-    
+# 健康检查结果缓存 1 秒：并发的探针排队等同一次 Redis 检查，之后直接复用结果
+HEALTH_CACHE_TTL = 1.0
+_health_lock = asyncio.Lock()
+_health_cache: Optional[tuple] = None  # (检查时间, 结果)
+
+async def _check_health() -> dict:
+    """实际检查 Redis 并统计任务"""
     try:
         redis = await get_redis()
         await redis.ping()
         
-        # 统计活跃任务
+        # 统计活跃任务（一次 list_all_tasks 同时得到总数和运行中数量）
         tasks = await task_manager.list_all_tasks()
         active_tasks = len([t for t in tasks if t["status"] == "running"])
         
@@ -525,6 +626,17 @@ async def health_check():
             "error": str(e)
         }
 
+@app.get("/health")
+async def health_check():
+    """健康检查"""
+    global _health_cache
+    
+    async with _health_lock:
+        now = time.monotonic()
+        if _health_cache is None or now - _health_cache[0] >= HEALTH_CACHE_TTL:
+            _health_cache = (now, await _check_health())
+        return _health_cache[1]
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
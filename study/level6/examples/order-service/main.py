@@ -1,15 +1,36 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import Optional
+import orjson
 import uvicorn
 import httpx
+from cachetools import TTLCache
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 全局共享一个客户端：复用到用户/产品服务的 keep-alive 连接，避免每次下单重新建连
+    app.state.http = httpx.AsyncClient(
+        timeout=5.0,
+        limits=httpx.Limits(max_keepalive_connections=100),
+    )
+    yield
+    await app.state.http.aclose()
+
 
-app = FastAPI(title="Order Service")
+app = FastAPI(title="Order Service", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # 服务地址
 USER_SERVICE_URL = "http://user-service:8000"
 PRODUCT_SERVICE_URL = "http://product-service:8000"
 
+# 产品信息本地缓存（热门产品 30 秒内不再请求产品服务）
+product_cache = TTLCache(maxsize=1024, ttl=30)
+
 # 模拟数据库
 orders_db = {}
 order_id_counter = 1
@@ -25,9 +46,12 @@ class OrderCreate(BaseModel):
     product_id: int
     quantity: int
 
+# 健康检查响应固定不变：导入时序列化一次，探针请求直接返回字节
+_HEALTH_BYTES = orjson.dumps({"status": "healthy", "service": "order-service"})
+
 @app.get("/health")
-def health_check():
-    return {"status": "healthy", "service": "order-service"}
+async def health_check():
+    return Response(content=_HEALTH_BYTES, media_type="application/json")
 
 @app.get("/orders")
 def get_orders():
@@ -42,29 +66,46 @@ def get_order(order_id: int):
     return orders_db[order_id]
 
 @app.post("/orders")
-async def create_order(order: OrderCreate):
+async def create_order(order: OrderCreate, request: Request):
     """创建订单（调用其他服务）"""
     global order_id_counter
 
-    # 调用用户服务验证用户
-    async with httpx.AsyncClient() as client:
-        try:
-            user_response = await client.get(f"{USER_SERVICE_URL}/users/{order.user_id}")
-            if user_response.status_code == 404:
-                raise HTTPException(status_code=400, detail="User not found")
-            user = user_response.json()
-        except Exception as e:
-            raise HTTPException(status_code=503, detail="User service unavailable")
-
-    # 调用产品服务获取产品信息
-    async with httpx.AsyncClient() as client:
+    # 并发调用用户服务（验证用户）和产品服务（获取产品信息），两个请求互不依赖
+    # 产品信息命中本地缓存时只调用用户服务
+    client: httpx.AsyncClient = request.app.state.http
+    product = product_cache.get(order.product_id)
+    calls = [client.get(f"{USER_SERVICE_URL}/users/{order.user_id}")]
+    if product is None:
+        calls.append(client.get(f"{PRODUCT_SERVICE_URL}/products/{order.product_id}"))
+    responses = await asyncio.gather(*calls, return_exceptions=True)
+
+    user_response = responses[0]
+    if isinstance(user_response, Exception):
+        raise HTTPException(status_code=503, detail="User service unavailable")
+    if user_response.status_code == 404:
+        raise HTTPException(status_code=400, detail="User not found")
+    if not user_response.is_success:
+        raise HTTPException(status_code=503, detail="User service unavailable")
+    try:
+        user = user_response.json()
+    except ValueError:
+        # 网关/代理返回的 502 等可能是 HTML，解析失败也按依赖不可用处理
+        raise HTTPException(status_code=503, detail="User service unavailable")
+
+    if product is None:
+        product_response = responses[1]
+        if isinstance(product_response, Exception):
+            raise HTTPException(status_code=503, detail="Product service unavailable")
+        if product_response.status_code == 404:
+            raise HTTPException(status_code=400, detail="Product not found")
+        # 只缓存成功响应：5xx 等错误体不能当作产品信息缓存 TTL 那么久
+        if not product_response.is_success:
+            raise HTTPException(status_code=503, detail="Product service unavailable")
         try:
-            product_response = await client.get(f"{PRODUCT_SERVICE_URL}/products/{order.product_id}")
-            if product_response.status_code == 404:
-                raise HTTPException(status_code=400, detail="Product not found")
             product = product_response.json()
-        except Exception as e:
+        except ValueError:
             raise HTTPException(status_code=503, detail="Product service unavailable")
+        product_cache[order.product_id] = product
 
     # 创建订单
     new_order = Order(
@@ -84,4 +125,4 @@ async def create_order(order: OrderCreate):
     }
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
@@ -1,9 +1,11 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import Optional
+import orjson
 import uvicorn
 
-app = FastAPI(title="Product Service")
+app = FastAPI(title="Product Service", default_response_class=ORJSONResponse)
 
 # 模拟数据库
 products_db = {
@@ -18,9 +20,12 @@ class Product(BaseModel):
     price: float
     stock: int
 
+# 健康检查响应固定不变：导入时序列化一次，探针请求直接返回字节
+_HEALTH_BYTES = orjson.dumps({"status": "healthy", "service": "product-service"})
+
 @app.get("/health")
-def health_check():
-    return {"status": "healthy", "service": "product-service"}
+async def health_check():
+    return Response(content=_HEALTH_BYTES, media_type="application/json")
 
 @app.get("/products", response_model=list[Product])
 def get_products():
@@ -35,4 +40,4 @@ def get_product(product_id: int):
     return products_db[product_id]
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
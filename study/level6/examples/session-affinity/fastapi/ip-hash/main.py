@@ -4,16 +4,24 @@
 这个示例展示如何使用 Nginx 的 ip_hash 指令实现会话保持。
 """
 
-from fastapi import FastAPI, Request
+from time import time
+
+from cachetools import TTLCache
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
+import orjson
 import os
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # 每个节点配置自己的服务名称
 SERVICE_NAME = os.getenv("SERVICE_NAME", "unknown")
 
 # 模拟本地会话存储（每个节点独立）
-local_sessions = {}
+# 用 TTLCache 限制条目数并自动过期，避免会话无限增长
+SESSION_MAX_SIZE = 50_000
+SESSION_TTL = 3600  # 1 小时
+local_sessions: TTLCache = TTLCache(maxsize=SESSION_MAX_SIZE, ttl=SESSION_TTL)
 
 @app.get("/")
 async def root(request: Request):
@@ -30,7 +38,7 @@ async def load_balancer_test(request: Request):
     return {
         "service": SERVICE_NAME,
         "client_ip": request.client.host,
-        "timestamp": __import__("time").time()
+        "timestamp": time()
     }
 
 @app.post("/api/login")
@@ -38,14 +46,13 @@ async def login(username: str, password: str, request: Request):
     """用户登录（模拟）"""
     # 模拟验证
     if username != "admin" or password != "admin":
-        from fastapi import HTTPException
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # 存储在本地会话
     session_id = request.client.host  # 使用 IP 作为会话 ID
     local_sessions[session_id] = {
         "username": username,
-        "login_time": __import__("time").time()
+        "login_time": time()
     }
     
     return {
@@ -61,7 +68,6 @@ async def get_session(request: Request):
     session_data = local_sessions.get(session_id)
     
     if not session_data:
-        from fastapi import HTTPException
         raise HTTPException(status_code=404, detail="Session not found")
     
     return {
@@ -70,14 +76,14 @@ async def get_session(request: Request):
         "session": session_data
     }
 
+# 健康检查响应固定不变：导入时序列化一次，探针请求直接返回字节
+_HEALTH_BYTES = orjson.dumps({"status": "healthy", "service": SERVICE_NAME})
+
 @app.get("/health")
 async def health_check():
     """健康检查"""
-    return {
-        "status": "healthy",
-        "service": SERVICE_NAME
-    }
+    return Response(content=_HEALTH_BYTES, media_type="application/json")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
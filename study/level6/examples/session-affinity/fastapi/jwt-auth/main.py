@@ -4,16 +4,20 @@
 这个示例展示如何使用 JWT 实现无状态认证，并结合本地缓存优化性能。
 """
 
-from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 import jwt
 import hashlib
-from typing import Optional, Dict
+import os
+from typing import Any, NamedTuple, Optional, Dict
 from datetime import datetime, timedelta
 import json
+import orjson
+from cachetools import TLRUCache
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # JWT 配置
 SECRET_KEY = "your-secret-key-change-this-in-production"
@@ -26,9 +30,30 @@ users_db = {
     "2": {"id": "2", "username": "user", "email": "user@example.com"}
 }
 
+# 用户名索引（登录时按用户名 O(1) 查找，不再遍历 users_db）
+users_by_username: Dict[str, dict] = {u["username"]: u for u in users_db.values()}
+
 # 本地缓存（每个节点独立）
-# key: user_id:resource, value: data_dict
-local_cache: Dict[str, dict] = {}
+# key: user_id:resource, value: CacheEntry(data_dict, ttl)
+# 有上限（超出时按 LRU 淘汰），每个条目按自己的 ttl 过期，避免内存无限增长
+DEFAULT_CACHE_TTL = 300  # 默认 5 分钟
+CACHE_MAX_SIZE = 10_000
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    ttl: int
+
+
+def _cache_ttu(key: str, entry: CacheEntry, now: float) -> float:
+    """条目过期时间 = 写入时间 + 条目自己的 ttl"""
+    return now + entry.ttl
+
+
+local_cache: TLRUCache = TLRUCache(maxsize=CACHE_MAX_SIZE, ttu=_cache_ttu)
+
+# 反向索引 user_id -> 该用户的缓存键，按用户清除缓存时不必扫描全部键
+user_index: Dict[str, set] = {}
 
 class LoginRequest(BaseModel):
     username: str
@@ -37,7 +62,7 @@ class LoginRequest(BaseModel):
 class CacheItem(BaseModel):
     key: str
     value: dict
-    ttl: int = 300  # 默认 5 分钟
+    ttl: int = DEFAULT_CACHE_TTL
 
 # JWT 认证
 security = HTTPBearer()
@@ -48,17 +73,14 @@ def verify_token(
     """验证 JWT Token"""
     token = credentials.credentials
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        
-        # 检查过期时间
-        exp = payload.get("exp")
-        if exp and exp < datetime.utcnow().timestamp():
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token expired"
-            )
-        
-        return payload
+        # jwt.decode 会校验 exp（过期抛 ExpiredSignatureError），
+        # require 要求 Token 必须带 exp，缺失时按无效 Token 处理
+        return jwt.decode(
+            token,
+            SECRET_KEY,
+            algorithms=[ALGORITHM],
+            options={"require": ["exp"]}
+        )
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -82,16 +104,20 @@ def get_cache_key(user_id: str, resource: str) -> str:
     """生成缓存键"""
     return f"{user_id}:{resource}"
 
+def cache_set(user_id: str, cache_key: str, entry: CacheEntry):
+    """写入本地缓存并登记到用户索引"""
+    local_cache[cache_key] = entry
+    # 顺带去掉该用户已过期或被淘汰的键，索引大小跟随缓存
+    keys = {k for k in user_index.get(user_id, ()) if k in local_cache}
+    keys.add(cache_key)
+    user_index[user_id] = keys
+
 # API 端点
 @app.post("/api/login")
 async def login(request_data: LoginRequest):
     """用户登录"""
     # 验证用户名密码
-    user = None
-    for uid, user_data in users_db.items():
-        if user_data["username"] == request_data.username:
-            user = user_data
-            break
+    user = users_by_username.get(request_data.username)
     
     if not user or request_data.password != "admin":
         raise HTTPException(
@@ -144,11 +170,12 @@ async def get_user_data(
     """获取用户数据（支持本地缓存）"""
     cache_key = get_cache_key(user_id, resource)
     
-    # 检查本地缓存
-    if cache_key in local_cache:
+    # 检查本地缓存（已过期的条目视为未命中）
+    entry = local_cache.get(cache_key)
+    if entry is not None:
         print(f"Local cache hit: {cache_key}")
         return {
-            "data": local_cache[cache_key],
+            "data": entry.value,
             "cache_level": "local",
             "service": os.getenv("SERVICE_NAME", "unknown")
         }
@@ -163,7 +190,7 @@ async def get_user_data(
     }
     
     # 写入本地缓存
-    local_cache[cache_key] = data
+    cache_set(user_id, cache_key, CacheEntry(data, DEFAULT_CACHE_TTL))
     
     return {
         "data": data,
@@ -179,10 +206,8 @@ async def set_user_cache(
 ):
     """设置用户缓存数据"""
     cache_key = get_cache_key(user_id, item.key)
-    local_cache[cache_key] = item.value
-    
-    # 这里可以设置 TTL（简单实现）
-    # 生产环境应该使用专门的缓存库
+    # 按请求中的 ttl 过期
+    cache_set(user_id, cache_key, CacheEntry(item.value, item.ttl))
     
     return {
         "message": "Cache updated",
@@ -200,14 +225,12 @@ async def clear_user_cache(
     if key:
         # 清除特定缓存
         cache_key = get_cache_key(user_id, key)
-        if cache_key in local_cache:
-            del local_cache[cache_key]
+        local_cache.pop(cache_key, None)
+        user_index.get(user_id, set()).discard(cache_key)
     else:
-        # 清除用户所有缓存
-        prefix = f"{user_id}:"
-        keys_to_delete = [k for k in local_cache.keys() if k.startswith(prefix)]
-        for k in keys_to_delete:
-            del local_cache[k]
+        # 清除用户所有缓存（通过索引直接定位，只处理该用户的键）
+        for k in user_index.pop(user_id, ()):
+            local_cache.pop(k, None)
     
     return {
         "message": "Cache cleared",
@@ -217,21 +240,22 @@ async def clear_user_cache(
 @app.get("/api/cache/stats")
 async def get_cache_stats():
     """获取缓存统计"""
+    # 先清掉已过期的条目，统计结果只包含有效缓存
+    local_cache.expire()
     return {
         "total_keys": len(local_cache),
         "keys": list(local_cache.keys()),
         "service": os.getenv("SERVICE_NAME", "unknown")
     }
 
+# 健康检查响应固定不变：导入时序列化一次，探针请求直接返回字节
+_HEALTH_BYTES = orjson.dumps({"status": "healthy", "service": os.getenv("SERVICE_NAME", "unknown")})
+
 @app.get("/health")
 async def health_check():
     """健康检查"""
-    return {
-        "status": "healthy",
-        "service": os.getenv("SERVICE_NAME", "unknown")
-    }
+    return Response(content=_HEALTH_BYTES, media_type="application/json")
 
 if __name__ == "__main__":
-    import os
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
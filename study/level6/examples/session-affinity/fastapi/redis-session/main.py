@@ -5,102 +5,345 @@
 """
 
 from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict
+from cachetools import TTLCache
 import aioredis
-import uuid
-import json
-from typing import Optional, Dict
+import secrets
+import msgpack
+import orjson
+from datetime import datetime
+from typing import Any, Optional, Dict
+import asyncio
 import os
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Redis 配置
 REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "")
+SERVICE_NAME = os.getenv("SERVICE_NAME", "unknown")
 SESSION_EXPIRE_SECONDS = 3600  # 1 小时
+SESSION_KEY_PREFIX = b"session:"  # 键用 bytes 拼接，客户端发送时无需再编码
+# Set-Cookie 头的属性固定，导入时拼好，新 Session 只需拼上 ID（生产环境应加上 "; Secure"）
+SESSION_COOKIE_PREFIX = b"session_id="
+SESSION_COOKIE_ATTRS = f"; HttpOnly; Max-Age={SESSION_EXPIRE_SECONDS}; Path=/; SameSite=lax".encode()
+USER_DATA_KEY_PREFIX = b"user:"
+USER_DATA_KEY_SUFFIX = b":data"
 
-# Redis 连接
+# Session 总数计数器：创建时 INCR、删除时 DECR，统计接口只需一次 GET
+# 过期的 Session 不会触发 DECR，后台定期用 SCAN 校正（最终一致）
+SESSION_COUNT_KEY = b"stats:session_count"
+SESSION_COUNT_RECONCILE_SECONDS = 300
+
+# 进程内短 TTL 缓存：session key -> {字段名: 序列化后的字节}
+# 同一用户几秒内的连续请求只读一次 Redis；其他节点的修改最多延迟 SESSION_CACHE_TTL 秒可见
+# 缓存的是不可变的字节，每次请求都重新反序列化出独立的 Session，不会被处理函数改坏
+SESSION_CACHE_TTL = 2
+SESSION_CACHE_SIZE = 10_000
+session_cache: TTLCache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+
+# Session 存成 Redis HASH（每个字段单独序列化），只写回改动过的字段
+# Session 字段和缓存用 msgpack 序列化（比 JSON 更小、更快），值前加一个版本字节
+# 没有版本字节的是旧的 JSON 数据：读取时仍能解析，下次写回时转成 msgpack
+MSGPACK_VERSION = b"\x01"
+
+# Redis 连接（启动时创建一次，请求里直接使用，不再每次检查是否已初始化）
+REDIS_URL = (
+    f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}" if REDIS_PASSWORD
+    else f"redis://{REDIS_HOST}:{REDIS_PORT}"
+)
+REDIS_MAX_CONNECTIONS = 50
 redis_client = None
 
-async def get_redis():
-    """获取 Redis 连接"""
-    global redis_client
-    if redis_client is None:
-        if REDIS_PASSWORD:
-            redis_client = await aioredis.from_url(
-                f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}",
-                encoding="utf-8",
-                decode_responses=True
-            )
-        else:
-            redis_client = await aioredis.from_url(
-                f"redis://{REDIS_HOST}:{REDIS_PORT}",
-                encoding="utf-8",
-                decode_responses=True
-            )
-    return redis_client
+# Lua 脚本：读取 Session，存在时顺带刷新过期时间（原子执行，一次往返）
+TOUCH_SESSION_LUA = """
+local fields = redis.call('HGETALL', KEYS[1])
+if #fields > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return fields
+"""
+touch_session = None  # 启动时注册；调用时走 EVALSHA，服务端缺少脚本（NOSCRIPT）时自动重新加载
+
+
+def pack(value: Any) -> bytes:
+    """序列化为 版本字节 + msgpack"""
+    return MSGPACK_VERSION + msgpack.packb(value, use_bin_type=True)
+
+
+def unpack(data: bytes) -> Any:
+    """反序列化，兼容旧的 JSON 数据（解析失败抛出 ValueError）"""
+    if data[:1] == MSGPACK_VERSION:
+        return msgpack.unpackb(data[1:], raw=False)
+    # orjson 直接解析 Redis 返回的 bytes，无需先解码成 str
+    return orjson.loads(data)
+
+
+class Session(dict):
+    """记录改动的 Session 字典：dirty 是新增/修改的字段，removed 是删除的字段
+
+    写入与原值相等的值不算改动；就地修改可变值（如 list.append）不会被记录，需重新赋值
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dirty: set = set()
+        self.removed: set = set()
+        self.legacy = False  # Redis 里是旧版整块存储的字符串，写回前需先删除
+        self.stored = False  # Redis 里已存在（用于维护 Session 计数）
+        self.durable = False  # 为 True 时中间件等 Redis 写入完成再返回响应
+
+    def __setitem__(self, key, value):
+        if key in self and self[key] == value:
+            return
+        super().__setitem__(key, value)
+        self.dirty.add(key)
+        self.removed.discard(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.dirty.discard(key)
+        self.removed.add(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        return super().pop(key, *default)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        self.removed.update(self)
+        self.dirty.clear()
+        super().clear()
+
+
+def session_from_fields(fields: Dict[str, bytes]) -> Session:
+    """逐个字段反序列化（损坏的字段丢弃）"""
+    session = Session()
+    for field, value in fields.items():
+        try:
+            dict.__setitem__(session, field, unpack(value))
+        except ValueError:
+            continue
+    session.stored = bool(fields)
+    return session
+
+
+async def load_session(redis, key: bytes) -> Session:
+    """加载 Session：先查进程内缓存，未命中时从 Redis HASH 读取并刷新过期时间"""
+    fields = session_cache.get(key)
+    if fields is not None:
+        return session_from_fields(fields)
+
+    try:
+        flat = await touch_session(keys=[key], args=[SESSION_EXPIRE_SECONDS], client=redis)
+    except aioredis.ResponseError:
+        # WRONGTYPE：旧版本把整个 Session 存成一个字符串，读出后标记为全部改动，保存时转成 HASH
+        session = Session()
+        data = await redis.get(key)
+        try:
+            session.update(unpack(data) if data else {})
+        except ValueError:
+            pass
+        session.legacy = True
+        session.stored = True
+        return session
+
+    # 脚本返回 [field1, value1, field2, value2, ...]
+    fields = {field.decode(): value for field, value in zip(flat[::2], flat[1::2])}
+    if fields:
+        session_cache[key] = fields
+    return session_from_fields(fields)
+
+
+async def save_session(redis, key: bytes, session: Session):
+    """只写回改动的字段；Session 被清空时删除整个 HASH（所有命令一个管道，一次往返）"""
+    if not (session.dirty or session.removed or session.legacy):
+        # 没有改动：过期时间已在读取时由 touch 脚本刷新，不再访问 Redis
+        return
+    if not session:
+        session_cache.pop(key, None)
+        if session.stored:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.delete(key)
+                pipe.decr(SESSION_COUNT_KEY)
+                await pipe.execute()
+        return
+    packed = {field: pack(session[field]) for field in session.dirty}
+
+    # 先更新进程内缓存（新建/迁移的 Session 所有字段都在 packed 里）：
+    # 写入可能在后台进行，本节点的下一个请求也能立刻读到刚写的值
+    cached = session_cache.get(key)
+    if session.legacy or not session.stored:
+        session_cache[key] = packed
+    elif cached is not None:
+        fields = {**cached, **packed}
+        for field in session.removed:
+            fields.pop(field, None)
+        session_cache[key] = fields
+
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            if not session.stored:
+                pipe.incr(SESSION_COUNT_KEY)
+            if session.legacy:
+                pipe.delete(key)
+            if session.removed:
+                pipe.hdel(key, *session.removed)
+            if packed:
+                pipe.hset(key, mapping=packed)
+            # 新建的 HASH 需要设置过期时间
+            pipe.expire(key, SESSION_EXPIRE_SECONDS)
+            await pipe.execute()
+    except BaseException:
+        # 写入失败：丢弃缓存里未落库的值，之后的请求回到 Redis 读取真实状态
+        # （否则登录保存失败返回 500 后，本节点仍会在缓存有效期内认为已登录）
+        session_cache.pop(key, None)
+        raise
+
+
+# 后台保存任务：保留引用，避免任务执行中被垃圾回收
+_pending: set = set()
+# 每个 Session 最近一次的保存任务：同一个键的保存按请求顺序串行执行，
+# 否则较早的写入可能晚于后来的清空/登出落到 Redis，把已删除的 Session 写回去
+_last_save: Dict[bytes, asyncio.Task] = {}
+
+
+async def save_session_after(redis, key: bytes, session: Session, previous: Optional[asyncio.Task]):
+    """等上一次保存结束（无论成败）再保存；asyncio.wait 不会把取消传给上一个任务"""
+    if previous is not None:
+        await asyncio.wait([previous])
+    await save_session(redis, key, session)
+
+
+def schedule_save(redis, key: bytes, session: Session) -> asyncio.Task:
+    """
+    把保存任务接在同一个键的上一次保存之后，返回保存任务
+
+    后台保存失败只记录日志（尽力而为：进程崩溃最多丢失最后一次请求的修改）；
+    需要确认写入的调用方自己等待任务并读取结果
+    """
+    task = asyncio.create_task(save_session_after(redis, key, session, _last_save.get(key)))
+    _pending.add(task)
+    _last_save[key] = task
+
+    def _done(t: asyncio.Task):
+        _pending.discard(t)
+        if _last_save.get(key) is t:
+            del _last_save[key]
+        if not t.cancelled() and t.exception() is not None and not session.durable:
+            print(f"Session save failed: {t.exception()}")
+
+    task.add_done_callback(_done)
+    return task
+
+
+async def count_sessions(redis) -> int:
+    """用 SCAN 分批统计 Session 键（KEYS 会一次扫完整个键空间并阻塞 Redis）"""
+    session_count = 0
+    async for _ in redis.scan_iter(match=SESSION_KEY_PREFIX + b"*", count=1000):
+        session_count += 1
+    return session_count
+
+
+async def reconcile_session_count():
+    """后台任务：定期用 SCAN 的结果校正 Session 计数（修正过期未 DECR 的部分）"""
+    while True:
+        try:
+            await redis_client.set(SESSION_COUNT_KEY, await count_sessions(redis_client))
+        except Exception as e:
+            print(f"Session count reconcile failed: {e}")
+        await asyncio.sleep(SESSION_COUNT_RECONCILE_SECONDS)
+
+
+reconcile_task: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def startup_event():
+    """创建 Redis 客户端（连接池大小固定），注册 Lua 脚本，启动 Session 计数校正任务"""
+    global redis_client, touch_session, reconcile_task
+    redis_client = aioredis.from_url(REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS)
+    touch_session = redis_client.register_script(TOUCH_SESSION_LUA)
+    reconcile_task = asyncio.create_task(reconcile_session_count())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """停止 Session 计数校正任务，等待后台保存完成，关闭 Redis 连接"""
+    if reconcile_task is not None:
+        reconcile_task.cancel()
+        await asyncio.gather(reconcile_task, return_exceptions=True)
+    await asyncio.gather(*_pending, return_exceptions=True)
+    if redis_client is not None:
+        await redis_client.close()
 
 # Session 中间件
 @app.middleware("http")
 async def session_middleware(request: Request, call_next):
     """Session 管理中间件"""
-    redis = await get_redis()
-    
     # 获取或创建 Session ID
     session_id = request.cookies.get("session_id")
     
     if not session_id:
         # 创建新 Session
-        session_id = str(uuid.uuid4())
-        request.state.session = {}
+        # 18 字节随机数 -> 24 字符 URL 安全 token（比 UUID 字符串更短）
+        session_id = secrets.token_urlsafe(18)
+        key = SESSION_KEY_PREFIX + session_id.encode()
+        request.state.session = Session()
         request.state.is_new_session = True
     else:
         # 加载现有 Session
-        session_data = await redis.get(f"session:{session_id}")
-        if session_data:
-            try:
-                request.state.session = json.loads(session_data)
-            except json.JSONDecodeError:
-                request.state.session = {}
-        else:
-            request.state.session = {}
+        key = SESSION_KEY_PREFIX + session_id.encode()
+        request.state.session = await load_session(redis_client, key)
         request.state.is_new_session = False
     
     # 处理请求
     response = await call_next(request)
     
-    # 保存 Session
-    if request.state.session:
-        await redis.setex(
-            f"session:{session_id}",
-            SESSION_EXPIRE_SECONDS,
-            json.dumps(request.state.session)
-        )
+    # 保存 Session（只写改动的字段）：默认放到后台执行，响应不必等待 Redis 确认
+    session = request.state.session
+    # 同一个键的保存按请求顺序串行；durable 的保存等写入完成，失败时让请求报错
+    task = schedule_save(redis_client, key, session)
+    if session.durable:
+        await asyncio.wait([task])
+        task.result()
     
-    # 设置 Cookie
+    # 设置 Cookie（token_urlsafe 生成的 ID 无需转义，直接拼接头部，不走 SimpleCookie）
     if request.state.is_new_session:
-        response.set_cookie(
-            key="session_id",
-            value=session_id,
-            max_age=SESSION_EXPIRE_SECONDS,
-            httponly=True,
-            secure=False,  # 生产环境应为 True
-            samesite="lax"
-        )
+        response.raw_headers.append((
+            b"set-cookie",
+            SESSION_COOKIE_PREFIX + session_id.encode() + SESSION_COOKIE_ATTRS,
+        ))
     
     return response
 
-def get_session(request: Request) -> dict:
+def get_session(request: Request) -> Session:
     """依赖注入：获取 Session"""
     return request.state.session
 
 # 数据模型
-class LoginRequest(BaseModel):
+class RequestModel(BaseModel):
+    """请求体模型共用的配置：拒绝未知字段，实例只读"""
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
+class LoginRequest(RequestModel):
     username: str
     password: str
 
-class SessionItem(BaseModel):
+class SessionItem(RequestModel):
     key: str
     value: str
 
@@ -108,7 +351,7 @@ class SessionItem(BaseModel):
 @app.post("/api/login")
 async def login(
     request_data: LoginRequest,
-    session: dict = Depends(get_session)
+    session: Session = Depends(get_session)
 ):
     """用户登录"""
     # 模拟验证
@@ -122,11 +365,13 @@ async def login(
     session["user_id"] = "1"
     session["username"] = request_data.username
     session["login_time"] = datetime.now().isoformat()
+    # 登录状态必须写入 Redis 后再返回，其他节点收到后续请求时才能读到
+    session.durable = True
     
     return {
         "message": "Login successful",
         "session": session,
-        "service": os.getenv("SERVICE_NAME", "unknown")
+        "service": SERVICE_NAME
     }
 
 @app.get("/api/session")
@@ -134,7 +379,7 @@ async def get_session_data(session: dict = Depends(get_session)):
     """获取 Session 数据"""
     return {
         "session": session,
-        "service": os.getenv("SERVICE_NAME", "unknown")
+        "service": SERVICE_NAME
     }
 
 @app.post("/api/session")
@@ -149,48 +394,30 @@ async def set_session_data(
         "message": "Session updated",
         "key": item.key,
         "value": item.value,
-        "service": os.getenv("SERVICE_NAME", "unknown")
+        "service": SERVICE_NAME
     }
 
 @app.delete("/api/session")
-async def clear_session(
-    request: Request,
-    session: dict = Depends(get_session)
-):
+async def clear_session(session: dict = Depends(get_session)):
     """清空 Session"""
+    # 清空后由中间件删除 Redis 中的 Session
     session.clear()
     
-    # 删除 Redis 中的 Session
-    session_id = request.cookies.get("session_id")
-    if session_id:
-        redis = await get_redis()
-        await redis.delete(f"session:{session_id}")
-    
     return {
         "message": "Session cleared",
-        "service": os.getenv("SERVICE_NAME", "unknown")
+        "service": SERVICE_NAME
     }
 
 @app.post("/api/logout")
-async def logout(
-    request: Request,
-    session: dict = Depends(get_session)
-):
+async def logout(session: dict = Depends(get_session)):
     """用户登出"""
-    # 清空 Session
+    # 清空 Session（由中间件删除 Redis 中的 Session）
     session.clear()
     
-    # 删除 Redis 中的 Session
-    session_id = request.cookies.get("session_id")
-    if session_id:
-        redis = await get_redis()
-        await redis.delete(f"session:{session_id}")
-    
     response = {"message": "Logout successful"}
     
     # 清除 Cookie
-    from fastapi.responses import JSONResponse
-    json_response = JSONResponse(content=response)
+    json_response = ORJSONResponse(content=response)
     json_response.delete_cookie("session_id")
     
     return json_response
@@ -210,23 +437,22 @@ async def get_current_user(session: dict = Depends(get_session)):
         "user_id": user_id,
         "username": session.get("username"),
         "login_time": session.get("login_time"),
-        "service": os.getenv("SERVICE_NAME", "unknown")
+        "service": SERVICE_NAME
     }
 
 @app.get("/api/users/{user_id}/data")
 async def get_user_data(user_id: str, session: dict = Depends(get_session)):
     """获取用户数据（使用 Redis 缓存）"""
-    redis = await get_redis()
-    cache_key = f"user:{user_id}:data"
+    cache_key = USER_DATA_KEY_PREFIX + user_id.encode() + USER_DATA_KEY_SUFFIX
     
     # 从 Redis 获取数据
-    data = await redis.get(cache_key)
+    data = await redis_client.get(cache_key)
     
     if data:
         return {
-            "data": json.loads(data),
+            "data": unpack(data),
             "cache_level": "redis",
-            "service": os.getenv("SERVICE_NAME", "unknown")
+            "service": SERVICE_NAME
         }
     
     # 缓存未命中，模拟从数据库获取
@@ -237,46 +463,41 @@ async def get_user_data(user_id: str, session: dict = Depends(get_session)):
     }
     
     # 写入 Redis 缓存
-    await redis.setex(cache_key, 300, json.dumps(data))
+    await redis_client.setex(cache_key, 300, pack(data))
     
     return {
         "data": data,
         "cache_level": "database",
-        "service": os.getenv("SERVICE_NAME", "unknown")
+        "service": SERVICE_NAME
     }
 
 @app.get("/api/stats")
 async def get_stats():
     """获取统计信息"""
-    redis = await get_redis()
-    
-    # 获取所有 Session 键
-    session_keys = await redis.keys("session:*")
-    session_count = len(session_keys)
+    # 读计数器（O(1)），不再遍历键空间
+    session_count = max(0, int(await redis_client.get(SESSION_COUNT_KEY) or 0))
     
     return {
         "total_sessions": session_count,
-        "service": os.getenv("SERVICE_NAME", "unknown")
+        "service": SERVICE_NAME
     }
 
 @app.get("/health")
 async def health_check():
     """健康检查"""
     try:
-        redis = await get_redis()
-        await redis.ping()
+        await redis_client.ping()
         return {
             "status": "healthy",
-            "service": os.getenv("SERVICE_NAME", "unknown")
+            "service": SERVICE_NAME
         }
     except Exception as e:
         return {
             "status": "unhealthy",
-            "service": os.getenv("SERVICE_NAME", "unknown"),
+            "service": SERVICE_NAME,
             "error": str(e)
         }
 
 if __name__ == "__main__":
-    from datetime import datetime
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
@@ -1,9 +1,11 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import Optional
+import orjson
 import uvicorn
 
-app = FastAPI(title="User Service")
+app = FastAPI(title="User Service", default_response_class=ORJSONResponse)
 
 # 模拟数据库
 users_db = {
@@ -21,37 +23,50 @@ class UserCreate(BaseModel):
     name: str
     email: str
 
+# 用户列表响应缓存（已编码的 JSON 字节），创建/更新用户时失效
+_users_cache: Optional[bytes] = None
+
+# 健康检查响应固定不变：导入时序列化一次，探针请求直接返回字节
+_HEALTH_BYTES = orjson.dumps({"status": "healthy", "service": "user-service"})
+
 @app.get("/health")
-def health_check():
-    return {"status": "healthy", "service": "user-service"}
+async def health_check():
+    return Response(content=_HEALTH_BYTES, media_type="application/json")
 
 @app.get("/users", response_model=list[User])
-def get_users():
-    """获取所有用户"""
-    return list(users_db.values())
+async def get_users():
+    """获取所有用户（命中缓存时直接返回字节，跳过模型校验和序列化）"""
+    global _users_cache
+    if _users_cache is None:
+        _users_cache = orjson.dumps(list(users_db.values()))
+    return Response(content=_users_cache, media_type="application/json")
 
 @app.get("/users/{user_id}", response_model=User)
-def get_user(user_id: int):
+async def get_user(user_id: int):
     """获取单个用户"""
     if user_id not in users_db:
         raise HTTPException(status_code=404, detail="User not found")
     return users_db[user_id]
 
 @app.post("/users", response_model=User)
-def create_user(user: UserCreate):
+async def create_user(user: UserCreate):
     """创建用户"""
+    global _users_cache
     user_id = max(users_db.keys()) + 1
-    new_user = User(id=user_id, **user.dict())
-    users_db[user_id] = new_user
-    return new_user
+    # 统一以 dict 存储，列表缓存可以直接编码
+    users_db[user_id] = {"id": user_id, **user.model_dump()}
+    _users_cache = None
+    return users_db[user_id]
 
 @app.put("/users/{user_id}", response_model=User)
-def update_user(user_id: int, user: UserCreate):
+async def update_user(user_id: int, user: UserCreate):
     """更新用户"""
+    global _users_cache
     if user_id not in users_db:
         raise HTTPException(status_code=404, detail="User not found")
-    users_db[user_id] = User(id=user_id, **user.dict())
+    users_db[user_id] = {"id": user_id, **user.model_dump()}
+    _users_cache = None
     return users_db[user_id]
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")